@@ -0,0 +1,43 @@
+import argparse
+import time
+import numpy as np
+from core import ScorerEngine, load_real_db, recall_at_k, prefilter_mask
+
+# Отчёт: recall@K и скорость IVF против полного перебора на текущей базе
+def main():
+    parser = argparse.ArgumentParser(description="Recall@K of the IVF retriever against exact search")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--queries", type=int, default=200, help="Job descriptions sampled as queries")
+    parser.add_argument("--cv", nargs="*", default=[], help="CV PDFs used as extra queries")
+    parser.add_argument("--location", default=None)
+    parser.add_argument("--no-traps", action="store_true")
+    args = parser.parse_args()
+
+    engine = ScorerEngine()
+    df = load_real_db()
+    if df.empty: return print("⚠️ Database empty.")
+    exact = engine.retriever(df, mode='exact')
+
+    rng = np.random.default_rng(0)
+    queries = list(exact.vectors[rng.choice(len(df), min(args.queries, len(df)), replace=False)].float32())
+    queries += [engine.encode_cv(engine.extract_text_from_pdf(p)) for p in args.cv]
+    mask = prefilter_mask(df, args.location, not args.no_traps)
+    if not mask.all(): print(f"Pre-filter keeps {mask.sum()} of {len(df)} jobs")
+
+    t0 = time.perf_counter()
+    for q in queries: exact.search(q, max(args.k), mask)
+    exact_ms = (time.perf_counter() - t0) / len(queries) * 1000
+    print(f"{len(df)} jobs, {len(queries)} queries. exact: {exact_ms:.2f} ms/query")
+
+    ivf = engine.retriever(df, mode='ivf')
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        t0 = time.perf_counter()
+        for q in queries: ivf.search(q, max(args.k), mask)
+        ms = (time.perf_counter() - t0) / len(queries) * 1000
+        recalls = "  ".join(f"recall@{k}={recall_at_k(ivf, queries, k, mask):.3f}" for k in args.k)
+        print(f"ivf n_lists={ivf.n_lists} n_probe={n_probe}: {ms:.2f} ms/query  {recalls}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import streamlit as st
 import pandas as pd
-from collections import Counter
-import google.generativeai as genai
+import plotly.express as px
 import time
-from core import ScorerEngine, load_real_db
+import os
+from collections import Counter
+from core import ScorerEngine, JobStore, load_real_db, METRICS
+from cover_letters import CoverLetterService, make_backend
+
+TOP_K = 100
 
 st.set_page_config(page_title="AI Internship Scorer", layout="wide", page_icon="🚀")
 
@@ -58,14 +62,33 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 @st.cache_resource
-def get_engine(): return ScorerEngine()
+def get_engine():
+    # SCORER_SERVICE=http://127.0.0.1:8765 или unix:/path — одна модель на все сессии (scoring_service.py serve)
+    if os.environ.get("SCORER_SERVICE"):
+        from scoring_service import ScoringClient
+        return ScoringClient(os.environ["SCORER_SERVICE"])
+    return ScorerEngine()
 @st.cache_data(ttl=3600)
 def get_jobs(): return load_real_db()
+@st.cache_data(ttl=60)
+def get_service_meta(): return get_engine().meta()
+@st.cache_resource
+def get_market(): return JobStore().market
+@st.cache_resource
+def get_letter_service(api_key): return CoverLetterService(make_backend(api_key))
 
+run_stats = METRICS.new_run()
 engine = get_engine()
-df_jobs = get_jobs()
+if os.environ.get("SCORER_SERVICE"):
+    # База живёт в сервисе: воркеру Streamlit нужны только число вакансий и города
+    df_jobs, meta = None, get_service_meta()
+    n_jobs, all_locs = meta["jobs"], meta["locations"]
+else:
+    df_jobs = get_jobs()
+    n_jobs, all_locs = len(df_jobs), sorted(df_jobs['Location'].astype(str).unique().tolist()) if len(df_jobs) else []
 
 if 'calculated' not in st.session_state: st.session_state.calculated = False
+if 'letters' not in st.session_state: st.session_state.letters = {}
 
 if "GEMINI_API_KEY" in st.secrets:
     api_key = st.secrets["GEMINI_API_KEY"]
@@ -81,38 +104,51 @@ with st.sidebar:
     manual_text = st.text_area("Or paste text:", height=100)
     st.divider()
     st.subheader("🎯 Filters")
-    if not df_jobs.empty:
-        unique_locs = sorted(df_jobs['Location'].astype(str).unique().tolist())
-        locations = ["All Locations"] + unique_locs
+    if n_jobs:
+        locations = ["All Locations"] + all_locs
         selected_loc = st.selectbox("📍 City", locations)
         
         # ГАЛОЧКА ДЛЯ ПОКАЗА МУСОРА
         show_traps = st.checkbox("🕵️ Show Filtered 'Traps'", value=True, help="Show jobs that AI flagged as fake juniors")
     st.markdown("---")
+    show_debug = st.checkbox("🐞 Debug timings", value=False)
     st.caption("v3.0 • Trap Detector")
 
-def generate_cover_letter_gemini(api_key, cv_text, job_description, company_name, job_title):
-    if not api_key: return "⚠️ API Key missing."
-    genai.configure(api_key=api_key)
-    models = ['models/gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-pro']
-    for model_name in models:
-        try:
-            time.sleep(0.3)
-            model = genai.GenerativeModel(model_name)
-            with st.spinner(f"✨ Generating..."):
-                prompt = f"Write a 150-word cover letter. RESUME: {cv_text[:1000]}. JOB: {job_title} at {company_name}. DESC: {job_description[:1000]}. No placeholders."
-                response = model.generate_content(prompt)
-                if response.text: return response.text
-        except: continue
-    return "❌ AI error."
+def submit_cover_letter(api_key, *letter_args):
+    # Письма генерируются в фоне: можно поставить в очередь несколько вакансий сразу
+    future = get_letter_service(api_key).submit(*letter_args)
+    st.session_state.letters[CoverLetterService.key(*letter_args)] = future
+    return future
 
 st.markdown('<h1 class="title-text">AI Internship Scorer 🚀</h1>', unsafe_allow_html=True)
 st.markdown("### Find your perfect match (and avoid traps).")
 
-if df_jobs.empty:
+if not n_jobs:
     st.warning("⚠️ Database empty. Please run `python ingest_ai.py`.")
     st.stop()
 
+# === MARKET INSIGHTS: готовые агрегаты из хранилища, описания не перечитываются ===
+with st.expander("📊 Market Insights"):
+    market = get_market()
+    market.refresh()
+    top_skills = market.top_skills(15, selected_loc)
+    if not top_skills: st.caption("No skills found for this location yet.")
+    else:
+        col_skills, col_pairs = st.columns(2)
+        with col_skills:
+            fig = px.bar(pd.DataFrame(top_skills, columns=['Skill', 'Jobs']), x='Jobs', y='Skill', orientation='h', title=f"Top skills • {selected_loc}")
+            fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+            st.plotly_chart(fig, use_container_width=True)
+        with col_pairs:
+            fig = px.imshow(market.cooccurring([s for s, _ in top_skills[:10]]), text_auto=True, color_continuous_scale='Blues', title="Skills asked together")
+            st.plotly_chart(fig, use_container_width=True)
+    rates = market.company_rates(min_jobs=2).head(15)
+    if not rates.empty:
+        fig = px.bar(rates, x='company', y=['trap_rate', 'senior_rate'], barmode='group', title="Trap & senior share by company")
+        fig.update_layout(yaxis_tickformat='.0%', legend_title_text='')
+        st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{market.n_jobs} jobs • trap rules {market.rules_version}")
+
 cv_text = ""
 if uploaded_file: cv_text = engine.extract_text_from_pdf(uploaded_file)
 elif manual_text: cv_text = manual_text
@@ -128,27 +164,22 @@ if cv_text:
     st.markdown("---")
 
     if st.session_state.calculated:
-        filtered_df = df_jobs.copy()
-        if selected_loc != "All Locations":
-            filtered_df = filtered_df[filtered_df['Location'] == selected_loc]
-        
-        # ЛОГИКА ОТОБРАЖЕНИЯ ЛОВУШЕК
-        if not show_traps:
-            filtered_df = filtered_df[filtered_df['filter_status'] == 'Active']
+        # Город и ловушки — пре-фильтр, дальше скорим только top-K ближайших по смыслу
+        filtered_df = engine.search_jobs(cv_text, user_skills, df_jobs, top_k=TOP_K, location=selected_loc, include_traps=show_traps)
         
         if not filtered_df.empty:
-            descriptions = filtered_df['description'].tolist()
-            scores = engine.calculate_hybrid_score(cv_text, descriptions, user_skills)
-            filtered_df['Score'] = scores
             # Сортируем: сначала хорошие по скору, потом ловушки в конце
-            filtered_df = filtered_df.sort_values(by=['filter_status', 'Score'], ascending=[True, False])
+            with METRICS.stage("sort_values", items=len(filtered_df)):
+                filtered_df = filtered_df.sort_values(by=['filter_status', 'Score'], ascending=[True, False])
 
             st.subheader(f"🏆 Found {len(filtered_df)} Jobs")
             
+            render_start = time.perf_counter()
             for idx, row in filtered_df.iterrows():
                 score = row['Score']
-                missing = engine.analyze_gaps(user_skills, row['description'])
+                missing = row['Missing']
                 status = row['filter_status']
+                reposts = int(row.get('duplicates', 0) or 0)
                 
                 # === РАЗВИЛКА: ХОРОШАЯ ВАКАНСИЯ ИЛИ ЛОВУШКА? ===
                 
@@ -163,7 +194,7 @@ if cv_text:
                         <div style="display:flex; justify-content:space-between; align-items:center;">
                             <div style="flex: 1; padding-right: 20px;">
                                 <h3 style="margin:0; font-size: 1.4rem; color:inherit;">{row['title']}</h3>
-                                <p style="margin:6px 0 0 0; opacity:0.8;">🏢 <b>{row['company']}</b> &nbsp;•&nbsp; 📍 {row['Location']}</p>
+                                <p style="margin:6px 0 0 0; opacity:0.8;">🏢 <b>{row['company']}</b> &nbsp;•&nbsp; 📍 {row['Location']}{f" &nbsp;•&nbsp; 🔁 reposted {reposts}×" if reposts else ""}</p>
                             </div>
                             <div style="text-align:right; min-width: 120px;">
                                 <div class="big-score" style="color: {score_color};">{int(score)}%</div>
@@ -190,9 +221,19 @@ if cv_text:
                             st.write(row['description'])
                     with c3:
                         popover = st.popover("🤖 Draft Letter", use_container_width=True)
-                        if popover.button("Generate", key=f"gen_{idx}", type="primary"):
-                            letter = generate_cover_letter_gemini(api_key, cv_text, row['description'], row['company'], row['title'])
-                            popover.text_area("Result:", value=letter, height=300)
+                        letter_args = (cv_text, row['description'], row['company'], row['title'])
+                        g1, g2 = popover.columns(2)
+                        if g1.button("Generate", key=f"gen_{idx}", type="primary"):
+                            if not api_key: popover.warning("⚠️ API Key missing.")
+                            else:
+                                with popover, st.spinner("✨ Generating..."): submit_cover_letter(api_key, *letter_args).result()
+                        if g2.button("➕ Queue", key=f"queue_{idx}"):
+                            if not api_key: popover.warning("⚠️ API Key missing.")
+                            else: submit_cover_letter(api_key, *letter_args)
+                        future = st.session_state.letters.get(CoverLetterService.key(*letter_args))
+                        if future is not None:
+                            if future.done(): popover.text_area("Result:", value=future.result(), height=300, key=f"letter_{idx}")
+                            else: popover.info("⏳ Letter is being generated in the background — reopen to see it.")
 
                 else:
                     # --- RENDERING TRAP CARD (Ловушка) ---
@@ -224,8 +265,17 @@ if cv_text:
                          st.write(row['description'])
                 
                 st.write("") # Spacer
+            METRICS.record((time.perf_counter() - render_start) * 1000, "render_cards", items=len(filtered_df))
 
         else:
             st.info("No jobs found.")
 else:
-    st.info("👈 Upload your CV to start.")
\ No newline at end of file
+    st.info("👈 Upload your CV to start.")
+
+# === ПАНЕЛЬ ОТЛАДКИ: тайминги стадий этого перезапуска ===
+if show_debug:
+    with st.sidebar:
+        st.subheader("🐞 Stage timings")
+        if run_stats: st.dataframe(pd.DataFrame(run_stats).fillna(""), hide_index=True, use_container_width=True)
+        else: st.caption("Nothing measured in this run.")
+        st.caption(f"Engine cache: {engine.cache.hits} hits / {engine.cache.misses} misses, {engine.cache.size / 2**20:.1f} MB")
@@ -0,0 +1,117 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from core import ScorerEngine, load_real_db, pdf_text, skill_matrix, skill_vector, missing_skills, score_matrix, top_k
+
+# === ПАКЕТНЫЙ СКОРИНГ: папка CV × вся база вакансий, без Streamlit ===
+
+def read_cv(path):
+    # Выполняется в воркере: ошибки одного PDF не должны ронять весь прогон
+    try:
+        return path, pdf_text(path), None
+    except Exception as e:
+        return path, "", str(e)
+
+class ResultWriter:
+    """Пишет результаты по мере готовности: .jsonl построчно, .parquet — row group на каждый чанк."""
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._file = None if self.parquet else open(path, "w", encoding="utf-8")
+
+    def write(self, records):
+        if not records: return
+        if not self.parquet:
+            for r in records: self._file.write(json.dumps(r, ensure_ascii=False) + "\n")
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            string = pa.string()
+            schema = pa.schema([("cv", string), ("rank", pa.int32()), ("title", string), ("company", string), ("Location", string),
+                                ("url", string), ("score", pa.float64()), ("status", string), ("missing", pa.list_(string)), ("error", string)])
+            self._writer = pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(pa.Table.from_pylist(records, schema=self._writer.schema))
+
+    def close(self):
+        if self._file: self._file.close()
+        if self._writer: self._writer.close()
+
+def score_chunk(engine, chunk, jobs, top, batch_size=64):
+    """Скоринг чанка CV одной матрицей (вакансии × CV) и выбор top вакансий для каждого CV."""
+    df, job_embs, job_skills, mask = jobs
+    records = [{"cv": os.path.basename(p), "error": err or "empty text"} for p, text, err in chunk if err or not text.strip()]
+    chunk = [(p, text) for p, text, err in chunk if not err and text.strip()]
+    if not chunk: return records
+
+    cv_embs = engine.model.encode([text for _, text in chunk], batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+    cv_skills = engine.extract_skills_batch([text for _, text in chunk])
+    cv_vecs = np.stack([skill_vector(s) for s in cv_skills], axis=1)
+
+    scores = score_matrix(job_embs, job_skills, cv_embs, cv_vecs)
+    scores[~mask] = -np.inf
+
+    for j, (path, _) in enumerate(chunk):
+        best = top_k(scores[:, j], top)
+        best = best[np.isfinite(scores[best, j])]
+        gaps = missing_skills(job_skills[best], cv_vecs[:, j])
+        for rank, (row, missing) in enumerate(zip(best, gaps), 1):
+            job = df.iloc[row]
+            records.append({
+                "cv": os.path.basename(path), "rank": rank, "title": job['title'], "company": job['company'],
+                "Location": job['Location'], "url": job['url'], "score": float(scores[row, j]),
+                "status": job['filter_status'], "missing": missing,
+            })
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a folder of CV PDFs against the whole job DB")
+    parser.add_argument("folder", help="Folder with CV PDFs")
+    parser.add_argument("--out", default="batch_scores.jsonl", help="Output file (.jsonl or .parquet)")
+    parser.add_argument("--top", type=int, default=20, help="Jobs kept per CV")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for PDF extraction")
+    parser.add_argument("--chunk", type=int, default=128, help="CVs scored per matrix multiply (bounds memory)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Encoder batch size")
+    parser.add_argument("--active-only", action="store_true", help="Skip jobs flagged as traps")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.folder, "**", "*.pdf"), recursive=True))
+    if not paths: return print(f"⚠️ No PDFs in {args.folder}")
+
+    engine = ScorerEngine()
+    df = load_real_db()
+    if df.empty: return print("⚠️ Database empty. Please run `python ingest_ai.py`.")
+    job_skills = skill_matrix(df['skills'])
+    mask = (df['filter_status'] == 'Active').to_numpy() if args.active_only else np.ones(len(df), dtype=bool)
+    jobs = (df, engine.job_vectors(df), job_skills, mask)
+
+    print(f"📄 Scoring {len(paths)} CVs against {len(df)} jobs with {args.workers} workers...")
+    start = time.perf_counter()
+    done = failed = 0
+    writer = ResultWriter(args.out)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # Воркеры извлекают следующие PDF, пока текущий чанк кодируется и скорится
+            results = pool.map(read_cv, paths, chunksize=4)
+            while True:
+                chunk = list(itertools.islice(results, args.chunk))
+                if not chunk: break
+                records = score_chunk(engine, chunk, jobs, args.top, args.batch_size)
+                writer.write(records)
+                failed += sum(1 for r in records if "error" in r)
+                done += len(chunk)
+                print(f"   {done}/{len(paths)} CVs ({done / (time.perf_counter() - start):.1f} CV/s)")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {done} CVs ({failed} failed) in {elapsed:.1f}s — {done / elapsed:.2f} CVs/second. Results: {args.out}")
+
+if __name__ == "__main__":
+    main()
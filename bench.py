@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from core import ScorerEngine, JobStore, NearDupIndex, SKILL_MATCHER, load_real_db, minhash, skill_matrix, tag_jobs
+from ingest_fake import generate_mock_jobs
+
+# === БЕНЧМАРК ГОРЯЧИХ ПУТЕЙ НА СИНТЕТИЧЕСКИХ КОРПУСАХ 1k-1M ===
+BASELINE_PATH = "bench_baseline.json"
+CV_TEXT = "Junior Python developer. Python, SQL, Pandas, NumPy, Docker, Git, Linux, English. University projects with scikit-learn and React."
+
+def measure(fn, items):
+    """
+    Время, пропускная способность и пик памяти (tracemalloc, включая буферы NumPy).
+    Память меряется вторым прогоном: трассировка аллокаций сама замедляет Python-код.
+    """
+    t0 = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": seconds, "items_per_s": items / seconds if seconds else float("inf"), "peak_mb": peak / 2**20}
+
+def run_size(engine, n, encode_sample, seed):
+    df = generate_mock_jobs(n, seed=seed, save=False)
+    descriptions = df['description'].tolist()
+    results = {}
+
+    results["extract_skills"] = measure(lambda: SKILL_MATCHER.find_batch(descriptions), n)
+    results["tag_jobs"] = measure(lambda: tag_jobs(df.copy()), n)
+    results["near_duplicates"] = measure(lambda: NearDupIndex().assign(range(n), df['title'], df['company'], df['Location'], minhash(descriptions)), n)
+
+    store_dir = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        JobStore(store_dir).append(df)
+        # Без схлопывания перепостов: скоринг ниже меряется на всех n строках
+        results["load_real_db"] = measure(lambda: load_real_db(path=store_dir, dedupe=False), n)
+        jobs = load_real_db(path=store_dir, dedupe=False)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    if engine is not None and encode_sample:
+        sample = descriptions[:encode_sample]
+        results["encode"] = measure(lambda: engine.model.encode(sample, normalize_embeddings=True, convert_to_numpy=True), len(sample))
+
+    # Скоринг на случайных нормализованных векторах: кодировать 1M описаний ради бенчмарка слишком долго
+    rng = np.random.default_rng(seed)
+    job_embs = rng.standard_normal((n, 384), dtype=np.float32)
+    job_embs /= np.linalg.norm(job_embs, axis=1, keepdims=True)
+    cv_emb = job_embs[0]
+    cv_skills = sorted(SKILL_MATCHER.find(CV_TEXT))
+    if engine is not None:
+        results["calculate_hybrid_score"] = measure(lambda: engine.calculate_hybrid_score(
+            CV_TEXT, jobs['description'].tolist(), cv_skills, skill_matrix(jobs['skills']), cv_emb=cv_emb, job_embs=job_embs), n)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Список регрессий: время выросло больше чем на tolerance относительно сохранённого baseline."""
+    regressions = []
+    for size, stages in results.items():
+        for stage, r in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base and r["seconds"] > base["seconds"] * (1 + tolerance):
+                regressions.append(f"{stage} @ {size}: {r['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scoring hot paths on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Corpus sizes (add 1000000 for the full run)")
+    parser.add_argument("--encode-sample", type=int, default=2000, help="Descriptions encoded per size (0 = skip encoding)")
+    parser.add_argument("--no-model", action="store_true", help="Skip stages that need the sentence-transformers model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline before failing")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    args = parser.parse_args()
+
+    engine = None if args.no_model else ScorerEngine()
+    results = {}
+    for n in args.sizes:
+        results[str(n)] = run_size(engine, n, args.encode_sample, args.seed)
+        print(f"\n📊 {n} jobs")
+        for stage, r in results[str(n)].items():
+            print(f"   {stage:<24} {r['seconds']:>9.3f}s  {r['items_per_s']:>12,.0f} items/s  {r['peak_mb']:>9.1f} MB peak")
+
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f: json.dump(results, f, indent=2)
+        return print(f"\n💾 Baseline saved to {args.baseline}")
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f: regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:\n   " + "\n   ".join(regressions))
+            sys.exit(1)
+        print(f"\n✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
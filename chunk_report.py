@@ -0,0 +1,61 @@
+import argparse
+import numpy as np
+import pandas as pd
+from core import ScorerEngine, ChunkedEncoder, JOBS_CSV, MAX_TOKENS, CHUNK_OVERLAP, SKILL_MATCHER, skill_matrix, skill_vector, hybrid_score, score_drift, timed_encode
+
+# Отчёт: обрезка описаний по окну модели против чанков с перекрытием — скорость кодирования и качество скоринга
+
+def self_rank(queries, embs):
+    """MRR и recall@1: насколько вакансия находит саму себя по своему фрагменту."""
+    ranks = 1 + ((embs @ queries.T) > (embs * queries).sum(axis=1)).sum(axis=0)
+    return float(np.mean(1 / ranks)), float(np.mean(ranks == 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Truncated vs chunked job-description embeddings")
+    parser.add_argument("--csv", default=JOBS_CSV)
+    parser.add_argument("--cv", nargs="*", default=[], help="CV PDFs used as queries")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--tail-words", type=int, default=60, help="Words from the end of a description used as a self-retrieval query")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).dropna(subset=['description'])
+    if df.empty: return print(f"⚠️ No jobs in {args.csv}")
+    engine = ScorerEngine()
+    chunked = ChunkedEncoder(engine.model, args.max_tokens, args.overlap)
+    texts = df['description'].astype(str).tolist()
+
+    chunks, owner, weight = chunked.chunks(texts)
+    long = np.bincount(owner, minlength=len(texts)) > 1
+    print(f"{len(texts)} jobs from {args.csv}: {long.sum()} longer than {args.max_tokens} tokens, "
+          f"{len(chunks)} chunks ({len(chunks) / len(texts):.2f} per job), max {weight.max():.0f} tokens per chunk")
+
+    truncated, trunc_s = timed_encode(engine.model, texts, args.batch_size)
+    pooled, chunk_s = timed_encode(chunked, texts, args.batch_size)
+    print(f"encode: truncated {len(texts) / trunc_s:.1f} jobs/s, chunked + length-sorted {len(texts) / chunk_s:.1f} jobs/s")
+    cos = (truncated * pooled).sum(axis=1)
+    print(f"cosine truncated↔chunked: all jobs {cos.mean():.4f}, long jobs {cos[long].mean() if long.any() else 1.0:.4f}")
+
+    # Самопоиск: заголовок и хвост описания (тот, что обрезка отбрасывает) должны находить свою вакансию
+    for name, queries in [("title", df['title'].astype(str).tolist()),
+                          (f"last {args.tail_words} words", [" ".join(t.split()[-args.tail_words:]) for t in texts])]:
+        q = np.asarray(engine.model.encode(queries, batch_size=args.batch_size), dtype=np.float32)
+        (mrr_t, r1_t), (mrr_c, r1_c) = self_rank(q, truncated), self_rank(q, pooled)
+        print(f"self-retrieval by {name}: MRR {mrr_t:.3f} → {mrr_c:.3f}, recall@1 {r1_t:.3f} → {r1_c:.3f}")
+
+    # Гибридные скоры для CV (или описаний как запросов): насколько меняются оценки и top-K
+    cv_texts = [engine.extract_text_from_pdf(p) for p in args.cv] or texts
+    cv_embs = np.stack([engine.encode_cv(t) for t in cv_texts], axis=1)
+    job_skills = skill_matrix(SKILL_MATCHER.find_batch(texts))
+    common = np.asarray(job_skills @ np.stack([skill_vector(s) for s in engine.extract_skills_batch(cv_texts)], axis=1))
+    totals = np.diff(job_skills.indptr)[:, None]
+    ref, got = hybrid_score(truncated @ cv_embs, common, totals), hybrid_score(pooled @ cv_embs, common, totals)
+    worst, mean, overlap = score_drift(ref, got, args.k)
+    long_dev = np.abs(ref - got)[long].mean() if long.any() else 0.0
+    print(f"hybrid score change over {len(cv_texts)} queries: max {worst:.2f}, mean {mean:.3f} points "
+          f"(long jobs {long_dev:.3f}); top-{min(args.k, len(texts))} overlap {overlap:.3f}")
+
+if __name__ == "__main__":
+    main()
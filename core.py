@@ -1,9 +1,48 @@
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
-import pdfplumber
+from scipy import sparse
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import logging
+import glob
+import time
+import pickle
+import json
+import io
 import re
+import struct
 import os
+import sys
+import threading
+import weakref
+import zlib
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+ENCODER = os.environ.get("SCORER_ENCODER", "torch")  # torch | onnx
+ONNX_DIR = "onnx_model"  # model_int8.onnx + tokenizer.json, создаётся export_onnx.py
+MAX_TOKENS = 256  # max_seq_length all-MiniLM-L6-v2
+CHUNK_OVERLAP = 32  # токенов перекрытия между соседними чанками длинного описания
+EMB_PRECISION = os.environ.get("SCORER_EMB_PRECISION", "float32")  # float32 | float16 | int8 — векторы вакансий в памяти
+EMB_PATH = "job_embeddings.npy"  # у каждого энкодера свой индекс: job_embeddings.<энкодер>.npy, см. emb_paths
+EMB_KEYS_PATH = "job_embeddings.keys"  # первая строка — модель, дальше хэш описания на строку
+EMB_HEADER_BYTES = 256  # заголовок .npy фиксированной длины: число строк переписывается на месте
+ANN_PATH = "job_ivf.npz"
+IVF_MIN_JOBS = 20000  # меньше — полный перебор быстрее любого индекса
+PARALLEL_PDF_PAGES = 12  # с такого числа страниц PDF разбирается в нескольких процессах
+CACHE_MB = 256
+DISK_CACHE_MB = 1024  # второй уровень кэша на диске (SCORER_CACHE_DIR): самые давно читанные файлы удаляются
+RESULTS_CACHE_MB = 64  # скоры CV по всей базе: float64 + разреженная матрица пробелов на каждый CV
+JOBS_CSV = "live_jobs.csv"
+JOB_STORE_DIR = "job_store"
+MARKET_STATS_FILE = "market_stats.json"
+JOB_STORE_MAX_PARTS = 32  # больше частей — склеиваем в одну при следующем добавлении
+DEDUP_PERM = 128  # хеш-функций MinHash на описание
+DEDUP_BANDS = 16  # полос LSH по 8 значений: кандидаты — пары с Жаккаром от ~0.7 (при 0.8 находятся 95%)
+DEDUP_THRESHOLD = 0.8  # оценка Жаккара шинглов описания, с которой вакансия — перепост
+DEDUP_TITLE_THRESHOLD = 0.75  # и доля общих слов заголовка
 
 TECH_KEYWORDS = [
     "python", "java", "c++", "c#", ".net", "javascript", "typescript", "html", "css", "sql", "nosql", "r", "bash", "go", "golang", "scala", "kotlin", "php", "ruby", "rust", "swift",
@@ -17,93 +56,1485 @@ TECH_KEYWORDS = [
     "agile", "scrum", "kanban", "english", "teamwork", "communication", "problem solving", "oop", "algorithms", "data structures"
 ]
 
-class ScorerEngine:
+# Навыки с +/#/. — \b вокруг них не работает, ищем как отдельный токен между пробелами
+SPECIAL_SKILLS = ['c++', 'c#', '.net']
+
+def _clean_text(text):
+    return re.sub(r'[^a-z0-9+#]', ' ', " " + text.lower() + " ")
+
+def _trie_regex(words):
+    # Префиксное дерево -> regex: на каждой позиции проверяется одна ветка, а не 120 альтернатив.
+    # Жадный (?:...)? сначала пробует более длинный навык ("gitlab ci" раньше "gitlab").
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w: node = node.setdefault(ch, {})
+        node[''] = {}
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches: return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+    return build(trie)
+
+# === КОМПИЛИРОВАННЫЙ ПОИСК НАВЫКОВ ===
+class SkillMatcher:
+    """
+    Все навыки ищутся одним регулярным выражением за один проход по тексту.
+    Результат совпадает со старой проверкой re.search по каждому навыку отдельно.
+    """
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        special = [k for k in self.keywords if k in SPECIAL_SKILLS]
+        regular = [k for k in self.keywords if k not in SPECIAL_SKILLS]
+        parts = []
+        if special: parts.append(rf'(?<= ){_trie_regex(special)}(?= )')
+        if regular: parts.append(rf'{_trie_regex(regular)}(?![a-z0-9])')
+        # Lookahead даёт совпадения на каждом начале слова (перекрывающиеся навыки не теряются)
+        self.pattern = re.compile(rf'(?<![a-z0-9])(?=({"|".join(parts)}))')
+        # Навыки, вложенные в более длинные: "gitlab ci" -> "gitlab"
+        self.implied = {k: [o for o in self.keywords if o != k and self._slow_match(o, _clean_text(k))] for k in self.keywords}
+
+    @staticmethod
+    def _slow_match(skill, clean_text):
+        if skill in SPECIAL_SKILLS: return f" {skill} " in clean_text
+        return bool(re.search(r'\b' + re.escape(skill) + r'\b', clean_text))
+
+    def _collect(self, matches):
+        found = set(matches)
+        for k in list(found): found.update(self.implied[k])
+        return found
+
+    def find(self, text):
+        if not text: return set()
+        return self._collect(self.pattern.findall(_clean_text(text)))
+
+    def find_batch(self, texts):
+        """Один проход по всем текстам сразу: тексты склеиваются через \\x00, позиции мапятся обратно."""
+        texts = ["" if pd.isna(t) else str(t).replace("\x00", " ") for t in texts]
+        if not texts: return []
+        blob = re.sub(r'[^a-z0-9+#\x00]', ' ', " " + " \x00 ".join(texts).lower() + " ")
+        # Границы документов ищем в уже нормализованной строке (lower() может менять длину)
+        bounds = np.array([m.start() for m in re.finditer('\x00', blob)], dtype=np.int64)
+        hits = [(m.start(), m.group(1)) for m in self.pattern.finditer(blob)]
+        docs = np.searchsorted(bounds, [pos for pos, _ in hits])
+        found = [[] for _ in texts]
+        for doc, (_, skill) in zip(docs, hits): found[doc].append(skill)
+        return [self._collect(f) if t else set() for f, t in zip(found, texts)]
+
+SKILL_MATCHER = SkillMatcher(TECH_KEYWORDS)
+SKILL_INDEX = {s: i for i, s in enumerate(TECH_KEYWORDS)}
+SKILL_NAMES = np.array(TECH_KEYWORDS, dtype=object)
+
+# === МАТРИЦА ВАКАНСИЯ × НАВЫК ===
+def skill_matrix(skill_sets):
+    """CSR-матрица (n_jobs, len(TECH_KEYWORDS)) из списков навыков каждой вакансии."""
+    skill_sets = list(skill_sets)
+    lens = np.fromiter((len(s) for s in skill_sets), dtype=np.int64, count=len(skill_sets))
+    indptr = np.concatenate([[0], np.cumsum(lens)])
+    indices = np.fromiter((SKILL_INDEX[k] for s in skill_sets for k in s), dtype=np.int32, count=indptr[-1])
+    m = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(skill_sets), len(TECH_KEYWORDS)))
+    m.sort_indices()
+    return m
+
+def skill_vector(skills):
+    vec = np.zeros(len(TECH_KEYWORDS), dtype=np.float32)
+    vec[[SKILL_INDEX[k] for k in skills if k in SKILL_INDEX]] = 1
+    return vec
+
+def missing_skills(job_skills, cv_vec):
+    """Для каждой строки матрицы — навыки вакансии, которых нет в CV (в порядке TECH_KEYWORDS)."""
+    if job_skills.shape[0] == 0: return []
+    keep = cv_vec[job_skills.indices] == 0
+    rows = np.repeat(np.arange(job_skills.shape[0]), np.diff(job_skills.indptr))
+    counts = np.bincount(rows[keep], minlength=job_skills.shape[0])
+    names = SKILL_NAMES[job_skills.indices[keep]].tolist()
+    ends = np.cumsum(counts).tolist()
+    return [names[a:b] for a, b in zip([0] + ends[:-1], ends)]
+
+def skill_lists(matrix):
+    """Названия навыков по строкам матрицы (например, готовой матрицы пробелов)."""
+    return missing_skills(matrix, np.zeros(matrix.shape[1], dtype=np.float32))
+
+def content_hash(text):
+    data = text if isinstance(text, bytes) else str(text).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+def _sizeof(value):
+    if isinstance(value, np.ndarray): return value.nbytes
+    if sparse.issparse(value): return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    if isinstance(value, (str, bytes)): return len(value)
+    if isinstance(value, (list, tuple, set, frozenset)): return 64 + sum(_sizeof(v) + 8 for v in value)
+    return sys.getsizeof(value)
+
+# === КЭШ ПО ХЭШУ СОДЕРЖИМОГО ===
+class LRUCache:
+    """
+    LRU-кэш с ограничением по размеру (байты), ключи — хэши содержимого. Потокобезопасен:
+    движок общий для всех сессий Streamlit.
+    disk_dir — необязательный второй уровень: вытесненное из памяти переживает рестарт процесса.
+    Он тоже ограничен (disk_max_bytes): при переполнении удаляются файлы, которые дольше всех не читались.
+    """
+    def __init__(self, max_bytes=CACHE_MB * 2**20, disk_dir=None, disk_max_bytes=DISK_CACHE_MB * 2**20):
+        self.max_bytes, self.disk_dir, self.disk_max_bytes = max_bytes, disk_dir, disk_max_bytes
+        self._items = OrderedDict()
+        self._disk = OrderedDict()  # путь -> байты, от давно не читанных к свежим
+        self._lock = threading.Lock()
+        self.size = self.disk_size = 0
+        self.hits = self.misses = self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            files = []
+            for entry in os.scandir(disk_dir):
+                if entry.name.endswith(".pkl"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, entry.path, st.st_size))
+            for _, path, size in sorted(files): self._disk[path] = size
+            self.disk_size = sum(self._disk.values())
+            self._evict_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key.replace(":", "_") + ".pkl")
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f: value = pickle.load(f)
+                os.utime(path)  # порядок вытеснения с диска переживает рестарт
+            except Exception: pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value)
+                    if path in self._disk: self._disk.move_to_end(path)
+                return value
+        with self._lock: self.misses += 1
+        return default
+
+    def put(self, key, value):
+        with self._lock: self._store(key, value)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f: pickle.dump(value, f)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+            with self._lock:
+                self.disk_size += size - self._disk.pop(path, 0)
+                self._disk[path] = size
+            self._evict_disk()
+
+    def _store(self, key, value):
+        if key in self._items: self.size -= self._items.pop(key)[1]
+        size = _sizeof(value)
+        if size > self.max_bytes: return
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, old) = self._items.popitem(last=False)
+            self.size -= old
+
+    def _evict_disk(self):
+        stale = []
+        with self._lock:
+            while self.disk_size > self.disk_max_bytes and self._disk:
+                path, size = self._disk.popitem(last=False)
+                self.disk_size -= size
+                stale.append(path)
+        for path in stale:
+            try: os.remove(path)
+            except OSError: pass
+
+    def __len__(self): return len(self._items)
+
+# === МЕТРИКИ ГОРЯЧИХ ПУТЕЙ ===
+metrics_log = logging.getLogger("scorer.metrics")
+if os.environ.get("SCORER_METRICS_LOG") and not metrics_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_log.addHandler(_handler)
+    metrics_log.setLevel(logging.INFO)
+
+class Metrics:
+    """
+    Время, число элементов и попадания в кэш по стадиям. Каждая стадия пишется JSON-строкой
+    в логгер scorer.metrics (включается SCORER_METRICS_LOG=1), итоги копятся в totals.
+    new_run() собирает стадии текущего запуска (в Streamlit у каждой сессии свой поток).
+    """
     def __init__(self):
-        print("Loading ML model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Model loaded.")
+        self.totals = {}
+        self._lock = threading.Lock()
+        self._run = ContextVar("scorer_metrics_run", default=None)
+
+    @contextmanager
+    def stage(self, name, items=0, **fields):
+        record = {"stage": name, "items": items, **fields}
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.record((time.perf_counter() - t0) * 1000, **record)
+
+    def record(self, ms, stage, items=0, **fields):
+        record = {"stage": stage, "ms": round(ms, 3), "items": items, **fields}
+        with self._lock:
+            total = self.totals.setdefault(stage, {"calls": 0, "ms": 0.0, "items": 0, "cache_hits": 0})
+            total["calls"] += 1
+            total["ms"] += record["ms"]
+            total["items"] += items or 0
+            total["cache_hits"] += bool(fields.get("cache_hit"))
+        run = self._run.get()
+        if run is not None: run.append(record)
+        if metrics_log.isEnabledFor(logging.INFO): metrics_log.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def new_run(self):
+        """Начинает сбор стадий для текущего потока/контекста (один перезапуск Streamlit-скрипта)."""
+        run = []
+        self._run.set(run)
+        return run
+
+METRICS = Metrics()
+
+# === ЭНКОДЕРЫ ===
+# sentence_transformers тянет за собой torch (секунды и сотни МБ), поэтому тяжёлые импорты
+# и загрузка модели откладываются до первого encode(): страница рендерится сразу.
+class TorchEncoder:
+    name = MODEL_NAME
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                print("Loading ML model...")
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True):
+        return (self._model or self._load()).encode(texts, batch_size=batch_size, normalize_embeddings=normalize_embeddings, convert_to_numpy=convert_to_numpy)
+
+    def token_offsets(self, texts):
+        """(начало, конец) в символах для каждого токена без [CLS]/[SEP] и без обрезки."""
+        tokenizer = (self._model or self._load()).tokenizer
+        return tokenizer(list(texts), add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+
+class OnnxEncoder:
+    """
+    Та же модель, экспортированная в ONNX с int8-квантизацией весов (export_onnx.py), на onnxruntime CPU.
+    Mean pooling + нормализация повторяют пайплайн sentence-transformers.
+    """
+    name = MODEL_NAME + ":onnx-int8"
+
+    def __init__(self, model_dir=ONNX_DIR):
+        self.model_dir = model_dir
+        self._session = self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+                print("Loading ONNX model...")
+                tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+                self._splitter = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+                self._splitter.no_truncation()
+                self._splitter.no_padding()
+                tokenizer.enable_truncation(MAX_TOKENS)
+                tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = ort.InferenceSession(os.path.join(self.model_dir, "model_int8.onnx"), options, providers=["CPUExecutionProvider"])
+                self._inputs = {i.name for i in session.get_inputs()}
+                self._dim = session.get_outputs()[0].shape[-1]
+                self._tokenizer, self._session = tokenizer, session
+        return self._session
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True):
+        session = self._session or self._load()
+        single = isinstance(texts, str)
+        texts = [texts] if single else [str(t) for t in texts]
+        parts = []
+        for i in range(0, len(texts), batch_size):
+            enc = self._tokenizer.encode_batch(texts[i:i + batch_size])
+            feed = {"input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                    "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+                    "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64)}
+            hidden = session.run(None, {k: v for k, v in feed.items() if k in self._inputs})[0]
+            mask = feed["attention_mask"][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if normalize_embeddings: emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+            parts.append(emb.astype(np.float32))
+        out = np.concatenate(parts) if parts else np.zeros((0, self._dim), dtype=np.float32)
+        return out[0] if single else out
+
+    def token_offsets(self, texts):
+        if self._session is None: self._load()
+        return [e.offsets for e in self._splitter.encode_batch([str(t) for t in texts], add_special_tokens=False)]
+
+class ChunkedEncoder:
+    """
+    Кодирование длинных текстов без обрезки: описание длиннее окна модели режется на чанки
+    по max_tokens с перекрытием overlap, векторы чанков усредняются с весом по числу токенов.
+    Все чанки сортируются по длине, поэтому в батче почти нет паддинга.
+    """
+    def __init__(self, encoder, max_tokens=MAX_TOKENS, overlap=CHUNK_OVERLAP):
+        self.encoder, self.max_tokens, self.overlap = encoder, max_tokens, overlap
+        self.name = f"{encoder.name}:chunk{max_tokens}-{overlap}"
+
+    def chunks(self, texts):
+        """(тексты чанков, номер исходного текста, токенов в чанке)."""
+        window = self.max_tokens - 2  # [CLS] и [SEP]
+        step = window - self.overlap
+        pieces = []
+        for i, (text, offsets) in enumerate(zip(texts, self.encoder.token_offsets(texts))):
+            n = len(offsets)
+            if n <= window:
+                pieces.append((text, i, max(n, 1)))
+                continue
+            for start in range(0, n, step):
+                end = min(start + window, n)
+                pieces.append((text[offsets[start][0]:offsets[end - 1][1]], i, end - start))
+                if end == n: break
+        return [p[0] for p in pieces], np.array([p[1] for p in pieces], dtype=np.int64), np.array([p[2] for p in pieces], dtype=np.float32)
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True):
+        single = isinstance(texts, str)
+        texts = [texts] if single else [str(t) for t in texts]
+        chunks, owner, weight = self.chunks(texts)
+        if not chunks: return np.zeros((0, 0), dtype=np.float32)
+        order = np.argsort(weight, kind='stable')
+        embs = np.asarray(self.encoder.encode([chunks[j] for j in order], batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+        embs[order] = embs.copy()
+        pool = sparse.csr_matrix((weight, (owner, np.arange(len(chunks)))), shape=(len(texts), len(chunks)))
+        out = np.asarray(pool @ embs, dtype=np.float32)
+        if normalize_embeddings: out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+def make_encoder(backend=ENCODER):
+    if backend == "onnx": return OnnxEncoder()
+    return TorchEncoder()
+
+# === ИНДЕКС ЭМБЕДДИНГОВ ВАКАНСИЙ ===
+@contextmanager
+def file_lock(path):
+    """Межпроцессная блокировка на время записи (fcntl, на Windows — msvcrt)."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try: msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1); break
+                except OSError: pass  # LK_LOCK сдаётся через 10 секунд — ждём дальше
+            try: yield
+            finally: f.seek(0); msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+def _npy_header(rows, dim):
+    # Заголовок .npy, дополненный пробелами до EMB_HEADER_BYTES (кратно 64, как требует формат)
+    text = repr({'descr': '<f4', 'fortran_order': False, 'shape': (rows, dim)}).encode("latin1")
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", EMB_HEADER_BYTES - 10) + text.ljust(EMB_HEADER_BYTES - 11) + b"\n"
+
+def emb_paths(model_name):
+    """(.npy, файл ключей) индекса эмбеддингов для энкодера: torch, onnx и чанкинг не затирают друг друга."""
+    slug = re.sub(r'[^A-Za-z0-9.-]+', '-', model_name).strip('-')
+    base, ext = os.path.splitext(EMB_PATH)
+    return f"{base}.{slug}{ext}", f"{os.path.splitext(EMB_KEYS_PATH)[0]}.{slug}.keys"
+
+class EmbeddingIndex:
+    """
+    Эмбеддинги вакансий на диске: .npy (открывается через mmap) + файл хэшей описаний по строке.
+    Строка i в .npy соответствует hashes[i]. Векторы нормализованы, cos_sim = dot.
+    Новые векторы дописываются в конец .npy (число строк в заголовке правится на месте), хэши —
+    в конец файла ключей, под межпроцессной блокировкой: запись стоит O(новых строк), а не всего индекса.
+    Индекс общий для всех сессий Streamlit: чтение и обновление — под self.lock, состояние
+    при перезагрузке подменяется целиком, без промежуточного пустого индекса.
+    """
+    def __init__(self, path=None, keys_path=None, model_name=MODEL_NAME):
+        default_path, default_keys = emb_paths(model_name)
+        self.path, self.keys_path, self.model_name = path or default_path, keys_path or default_keys, model_name
+        self.hashes, self.rows, self.vectors = [], {}, None
+        self._mtime = self._hash_array = None
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.hashes, self.rows, self.vectors, self._mtime = self._read()
+
+    def _read(self):
+        empty = [], {}, None, None
+        if not os.path.exists(self.path): self._adopt()
+        if not (os.path.exists(self.path) and os.path.exists(self.keys_path)): return empty
+        try:
+            with open(self.keys_path, encoding="utf-8") as f: text = f.read()
+            # Недописанная последняя строка (другой процесс пишет прямо сейчас) не считается
+            model, *hashes = text[:text.rfind("\n") + 1].splitlines() or [""]
+            vectors = np.load(self.path, mmap_mode='r')
+        except Exception as e:
+            print(f"⚠️ Embedding index unreadable, rebuilding: {e}")
+            return empty
+        # Индекс от другой модели — пересобираем с нуля
+        if model != self.model_name: return empty
+        # Запись прервалась между векторами и хэшами — берём общую целую часть
+        n = min(len(hashes), len(vectors))
+        return hashes[:n], {h: i for i, h in enumerate(hashes[:n])}, vectors[:n], self._stamp()
+
+    def _stamp(self):
+        st = os.stat(self.keys_path)
+        return st.st_mtime_ns, st.st_size
+
+    def _adopt(self):
+        # Общий индекс до разделения по энкодерам (job_embeddings.npy + .keys или старый .json
+        # {"model", "hashes"}) забираем себе, если он посчитан той же моделью
+        legacy = os.path.splitext(EMB_KEYS_PATH)[0] + ".json"
+        if self.path == EMB_PATH or not os.path.exists(EMB_PATH): return
+        with file_lock(EMB_PATH + ".lock"):
+            if os.path.exists(self.path) or not os.path.exists(EMB_PATH): return
+            try:
+                if os.path.exists(EMB_KEYS_PATH):
+                    with open(EMB_KEYS_PATH, encoding="utf-8") as f: model, hashes = f.readline().rstrip("\n"), None
+                else:
+                    with open(legacy, encoding="utf-8") as f: meta = json.load(f)
+                    model, hashes = meta.get("model", ""), meta.get("hashes", [])
+            except Exception: return
+            if model != self.model_name: return
+            if hashes is None: os.replace(EMB_KEYS_PATH, self.keys_path)
+            else: self._write_keys(model, hashes)
+            os.replace(EMB_PATH, self.path)
+
+    def _write_keys(self, model, hashes):
+        tmp = f"{self.keys_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write("".join(line + "\n" for line in [model] + list(hashes)))
+        os.replace(tmp, self.keys_path)
+
+    @property
+    def hash_array(self):
+        # Для векторной проверки emb_row из хранилища вакансий
+        with self.lock:
+            if self._hash_array is None or len(self._hash_array) != len(self.hashes): self._hash_array = np.array(self.hashes, dtype=object)
+            return self._hash_array
+
+    def refresh(self):
+        # Ингест мог дописать индекс из другого процесса
+        with self.lock:
+            if os.path.exists(self.keys_path) and self._stamp() != self._mtime: self.load()
+
+    def __len__(self): return len(self.hashes)
+
+    def update(self, model, texts):
+        """Кодирует только новые описания и дописывает их в индекс. Возвращает хэши texts."""
+        with self.lock: return self._update(model, texts)
+
+    def _update(self, model, texts):
+        self.refresh()
+        hashes = [content_hash(t) for t in texts]
+        new = {}
+        for h, t in zip(hashes, texts):
+            if h not in self.rows and h not in new: new[h] = str(t)
+        if new:
+            embs = model.encode(list(new.values()), normalize_embeddings=True, convert_to_numpy=True)
+            self._append(list(new.keys()), np.asarray(embs, dtype=np.float32))
+        return hashes
+
+    def lookup(self, model, texts):
+        """Матрица (len(texts), dim) из mmap, недостающие строки докодируются."""
+        with self.lock:
+            hashes = self.update(model, texts)
+            rows = np.fromiter((self.rows[h] for h in hashes), dtype=np.int64, count=len(hashes))
+            return self.vectors[rows]
+
+    def _append(self, hashes, embs):
+        # Вызывается из update под self.lock
+        with file_lock(self.path + ".lock"):
+            # Пока кодировали, другой процесс мог дописать те же описания
+            self.load()
+            keep = [i for i, h in enumerate(hashes) if h not in self.rows]
+            if not keep: return
+            hashes, embs = [hashes[i] for i in keep], np.ascontiguousarray(embs[keep])
+            old, dim = len(self.hashes), embs.shape[1]
+            if self.vectors is None: old = 0
+            if old == 0 or self.vectors.offset != EMB_HEADER_BYTES or self.vectors.shape[1] != dim:
+                # Новый индекс или .npy со стандартным заголовком: один раз переписываем целиком
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(_npy_header(old, dim))
+                    if old: f.write(np.ascontiguousarray(self.vectors).tobytes())
+                os.replace(tmp, self.path)
+                self._write_keys(self.model_name, self.hashes[:old])
+            self.vectors = None
+            with open(self.path, "r+b") as f:
+                # Сначала данные, потом заголовок: читатель видит либо старое, либо новое число строк
+                f.seek(EMB_HEADER_BYTES + old * dim * 4)
+                f.truncate()
+                f.write(embs.tobytes())
+                f.flush()
+                f.seek(0)
+                f.write(_npy_header(old + len(embs), dim))
+            with open(self.keys_path, "a", encoding="utf-8") as f: f.write("".join(h + "\n" for h in hashes))
+        self.load()
+
+# === КОМПАКТНОЕ ХРАНЕНИЕ ВЕКТОРОВ ===
+class CompactVectors:
+    """
+    Векторы вакансий в памяти как float32, float16 или int8 с масштабом на каждый вектор
+    (x ≈ q * scale, scale = max|x| / 127). float16 — 2x меньше памяти, int8 — 4x.
+    Скалярные произведения считаются по блокам: блок расширяется до float32 только на время умножения.
+    """
+    PRECISIONS = ('float32', 'float16', 'int8')
+
+    def __init__(self, vectors, precision='float32', scale=None, chunk=65536):
+        if precision not in self.PRECISIONS: raise ValueError(f"Unknown precision {precision!r}, expected one of {self.PRECISIONS}")
+        self.precision, self.chunk = precision, chunk
+        if scale is not None:
+            self.data, self.scale = vectors, scale
+        elif precision == 'int8':
+            vectors = np.asarray(vectors, dtype=np.float32)
+            self.scale = np.maximum(np.abs(vectors).max(axis=1, initial=0), 1e-12) / 127
+            self.data = np.round(vectors / self.scale[:, None]).astype(np.int8)
+        else:
+            self.data, self.scale = np.asarray(vectors, dtype=precision), None
+
+    @classmethod
+    def take(cls, source, rows, precision='float32', chunk=65536):
+        """Строки rows из float32-массива (mmap индекса) без полной float32-копии в памяти."""
+        if precision == 'float32': return cls(source[rows], precision)
+        parts = [cls(source[rows[i:i + chunk]], precision) for i in range(0, len(rows), chunk)]
+        if not parts: return cls(np.zeros((0, source.shape[1]), dtype=np.float32), precision)
+        scale = np.concatenate([p.scale for p in parts]) if precision == 'int8' else None
+        return cls(np.concatenate([p.data for p in parts]), precision, scale, chunk)
+
+    def __len__(self): return len(self.data)
+
+    @property
+    def nbytes(self): return self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __getitem__(self, rows):
+        return CompactVectors(self.data[rows], self.precision, self.scale[rows] if self.scale is not None else None, self.chunk)
+
+    def float32(self):
+        if self.scale is None: return self.data.astype(np.float32, copy=False)
+        return self.data.astype(np.float32) * self.scale[:, None]
+
+    def __matmul__(self, other):
+        """(n, dim) @ (dim,) или (dim, m) -> float32 скоры."""
+        other = np.asarray(other, dtype=np.float32)
+        if self.precision == 'float32': return self.data @ other
+        out = np.empty((len(self.data),) + other.shape[1:], dtype=np.float32)
+        for i in range(0, len(self.data), self.chunk):
+            part = self.data[i:i + self.chunk].astype(np.float32) @ other
+            if self.scale is not None: part *= self.scale[i:i + self.chunk].reshape((-1,) + (1,) * (other.ndim - 1))
+            out[i:i + self.chunk] = part
+        return out
+
+# === ОТБОР КАНДИДАТОВ (TOP-K) ===
+def top_k(scores, k):
+    """Индексы k лучших по убыванию без полной сортировки."""
+    k = min(k, len(scores))
+    if k <= 0: return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind='stable')]
+
+def masked_top_k(scores, mask, k):
+    """top_k только среди строк, где mask=True."""
+    rows = np.flatnonzero(mask)
+    return rows[top_k(scores[rows], k)]
+
+class JobRetriever:
+    """
+    Top-K вакансий по косинусной близости к CV (векторы нормализованы).
+    mode='exact' — полный перебор, mode='ivf' — инвертированные списки по центроидам k-means:
+    сканируются только n_probe ближайших кластеров. IVF сохраняется в path и пересобирается,
+    если поменялся набор вакансий. precision — формат векторов в памяти (см. CompactVectors).
+    """
+    def __init__(self, vectors, mode='exact', n_lists=None, n_probe=8, path=ANN_PATH, fingerprint=None, precision='float32'):
+        self.vectors = vectors if isinstance(vectors, CompactVectors) else CompactVectors(vectors, precision)
+        self.precision = self.vectors.precision
+        self.mode, self.n_probe, self.path = mode, n_probe, path
+        self.fingerprint = fingerprint
+        self.n_lists = n_lists or max(1, int(np.sqrt(len(self.vectors))))
+        self.centroids = self.order = self.offsets = None
+        if mode == 'ivf' and not self.load(): self.build()
+
+    def build(self, n_iter=15, sample=100000, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(self.vectors)
+        self.n_lists = min(self.n_lists, n)
+        train = self.vectors[rng.choice(n, min(n, sample), replace=False)].float32()
+        centroids = train[rng.choice(len(train), self.n_lists, replace=False)].copy()
+        # Сферический k-means: близость = скалярное произведение
+        for _ in range(n_iter):
+            assign = self._assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            empty = np.bincount(assign, minlength=self.n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        assign = self._assign(self.vectors, centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.n_lists))])
+        self.save()
+
+    @staticmethod
+    def _assign(x, centroids, chunk=65536):
+        return np.concatenate([np.argmax(x[i:i + chunk] @ centroids.T, axis=1) for i in range(0, len(x), chunk)]) if len(x) else np.zeros(0, dtype=np.int64)
+
+    def save(self):
+        if not self.path: return
+        np.savez(self.path, centroids=self.centroids, order=self.order, offsets=self.offsets, fingerprint=str(self.fingerprint))
+
+    def load(self):
+        if not (self.path and os.path.exists(self.path)): return False
+        try:
+            with np.load(self.path) as f:
+                if str(f['fingerprint']) != str(self.fingerprint) or len(f['order']) != len(self.vectors): return False
+                self.centroids, self.order, self.offsets = f['centroids'], f['order'], f['offsets']
+        except Exception: return False
+        self.n_lists = len(self.centroids)
+        return True
+
+    def search(self, query, k, mask=None):
+        """Возвращает (индексы строк, семантические скоры) top-k с учётом булевой маски пре-фильтра."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.mode == 'ivf':
+            lists = top_k(self.centroids @ query, self.n_probe)
+            cand = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            # Узкий фильтр: перебрать отфильтрованные строки дешевле (и точнее), чем кластеры
+            if mask is not None: cand = cand[mask[cand]] if mask.sum() > len(cand) else cand[:0]
+            # В ближайших кластерах меньше k кандидатов — добираем точным поиском
+            if len(cand) >= k:
+                scores = self.vectors[cand] @ query
+                best = top_k(scores, k)
+                return cand[best], scores[best]
+        cand = np.flatnonzero(mask) if mask is not None else np.arange(len(self.vectors))
+        scores = self.vectors[cand] @ query
+        best = top_k(scores, k)
+        return cand[best], scores[best]
+
+def recall_at_k(retriever, queries, k, mask=None):
+    """Доля точных top-k, которую нашёл retriever (эталон — полный перебор по тем же векторам)."""
+    exact = JobRetriever(retriever.vectors, mode='exact')
+    hits = []
+    for q in queries:
+        truth = exact.search(q, k, mask)[0]
+        if len(truth): hits.append(len(np.intersect1d(retriever.search(q, k, mask)[0], truth)) / len(truth))
+    return float(np.mean(hits)) if hits else 1.0
+
+def _pdf_pages(source, start, stop):
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        return [pdf.pages[i].extract_text() for i in range(start, min(stop, len(pdf.pages)))]
+
+def pdf_text(source, workers=1):
+    """
+    Текст PDF (путь, bytes или файловый объект). Функция модуля — её можно отдавать в ProcessPool.
+    Длинные PDF (путь или bytes) при workers > 1 разбираются диапазонами страниц в нескольких процессах.
+    """
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        n = len(pdf.pages)
+        if workers > 1 and n >= PARALLEL_PDF_PAGES and isinstance(source, (bytes, str)):
+            step = -(-n // workers)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = pool.map(_pdf_pages, [source] * workers, range(0, n, step), range(step, n + step, step))
+                pages = [t for part in parts for t in part]
+        else:
+            pages = [page.extract_text() for page in pdf.pages]
+    return "".join(t + "\n" for t in pages if t)
+
+def hybrid_score(semantic, common, totals):
+    """0.6 * семантика + 0.4 * доля навыков вакансии, найденных в CV (в процентах). Работает и для матриц."""
+    keyword_match = np.where(totals > 0, common / np.maximum(totals, 1), semantic)
+    hybrid = (semantic * 0.6) + (keyword_match * 0.4)
+    return np.round(hybrid.astype(np.float64) * 100, 1)
+
+def score_matrix(job_vectors, job_skills, cv_embs, cv_vecs):
+    """Гибридные скоры (вакансии × CV) одним умножением: cv_embs (CV × dim), cv_vecs (навыки × CV), job_skills — CSR."""
+    semantic = job_vectors @ cv_embs.T
+    common = np.asarray(job_skills @ cv_vecs)
+    return hybrid_score(semantic, common, np.diff(job_skills.indptr)[:, None])
+
+# === ОБЩЕЕ ДЛЯ ОТЧЁТОВ (export_onnx, quant_report, chunk_report) ===
+def timed_encode(encoder, texts, batch_size=32):
+    """(эмбеддинги float32, секунд на все texts); загрузка модели не входит в замер."""
+    encoder.encode(texts[:1])
+    t0 = time.perf_counter()
+    embs = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+    return embs, time.perf_counter() - t0
+
+def score_drift(ref, got, k):
+    """Насколько скоры got (вакансии × запросы) отходят от ref: (макс. и среднее отклонение в баллах, средняя доля общего top-k)."""
+    diff, k = np.abs(ref - got), min(k, len(ref))
+    overlap = np.mean([len(np.intersect1d(top_k(ref[:, j], k), top_k(got[:, j], k))) / k for j in range(ref.shape[1])])
+    return float(diff.max()), float(diff.mean()), float(overlap)
+
+_DB_VERSIONS = {}  # id(df) -> (weakref на df, версия)
+
+def db_version(df):
+    """
+    Версия базы для кэшей результатов: хэш строк (описание + статус) в их порядке.
+    Считается один раз на объект DataFrame; срез базы — другой объект и получает свою версию.
+    """
+    cached = _DB_VERSIONS.get(id(df))
+    if cached and cached[0]() is df: return cached[1]
+    hashes = df['content_hash'] if 'content_hash' in df else df['description'].map(content_hash)
+    rows = pd.util.hash_pandas_object(pd.DataFrame({'hash': hashes.to_numpy(), 'status': df['filter_status'].to_numpy()}), index=False)
+    version = f"{content_hash(rows.to_numpy().tobytes())[:16]}:{len(df)}"
+    key = id(df)
+    _DB_VERSIONS[key] = (weakref.ref(df, lambda _: _DB_VERSIONS.pop(key, None)), version)
+    return version
+
+def prefilter_mask(df, location=None, include_traps=True):
+    mask = np.ones(len(df), dtype=bool)
+    if location and location != "All Locations": mask &= (df['Location'] == location).to_numpy()
+    if not include_traps: mask &= (df['filter_status'] == 'Active').to_numpy()
+    return mask
+
+class ScorerEngine:
+    def __init__(self, cache_mb=CACHE_MB, cache_dir=os.environ.get("SCORER_CACHE_DIR"), pdf_workers=os.cpu_count() or 1, encoder=ENCODER,
+                 precision=EMB_PRECISION, chunked=True):
+        # Модель загрузится при первом кодировании; индекс привязан к бэкенду (векторы int8 и fp32 не смешиваем)
+        self.model = make_encoder(encoder)
+        # Описания вакансий кодируются чанками (без обрезки по 256 токенам), CV — как раньше
+        self.job_encoder = ChunkedEncoder(self.model) if chunked else self.model
+        self.index = EmbeddingIndex(model_name=self.job_encoder.name)
+        self._retriever = None
+        # Текст CV, навыки CV и эмбеддинги CV: повторные перезапуски Streamlit не пересчитывают их
+        self.cache = LRUCache(cache_mb * 2**20, cache_dir)
+        self.pdf_workers = pdf_workers
+        # Индекс на диске всегда float32; в памяти воркера векторы держатся в self.precision
+        self.precision = precision
+        # Скоры и пробелы CV по всей базе: смена города/ловушек — только маска поверх них
+        self.results = LRUCache(RESULTS_CACHE_MB * 2**20)
+        self._db = None
+        print(f"Engine ready ({self.model.name}). {len(self.index)} job embeddings indexed.")
 
     def extract_text_from_pdf(self, uploaded_file):
         try:
-            text = ""
-            with pdfplumber.open(uploaded_file) as pdf:
-                for page in pdf.pages:
-                    t = page.extract_text()
-                    if t: text += t + "\n"
+            if isinstance(uploaded_file, str):
+                with open(uploaded_file, "rb") as f: data = f.read()
+            else:
+                data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+            with METRICS.stage("extract_text_from_pdf", items=len(data)) as m:
+                key = "pdf:" + content_hash(data)
+                text = self.cache.get(key)
+                m["cache_hit"] = text is not None
+                if text is None:
+                    text = pdf_text(data, self.pdf_workers)
+                    self.cache.put(key, text)
             return text
         except Exception as e:
             return f"Error: {e}"
 
     def extract_skills(self, text):
         if not text: return []
-        text_lower = " " + text.lower() + " "
-        found = []
-        clean_text = re.sub(r'[^a-z0-9+#]', ' ', text_lower)
-        for skill in TECH_KEYWORDS:
-            if skill in ['c++', 'c#', '.net']:
-                if f" {skill} " in clean_text: found.append(skill)
-            else:
-                if re.search(r'\b' + re.escape(skill) + r'\b', clean_text): found.append(skill)
-        return list(set(found))
-
-    def calculate_hybrid_score(self, cv_text, job_descriptions, cv_skills):
-        cv_emb = self.model.encode(cv_text, convert_to_tensor=True)
-        job_embs = self.model.encode(job_descriptions, convert_to_tensor=True)
-        semantic_scores = util.cos_sim(cv_emb, job_embs)[0].tolist()
-        
-        final_scores = []
-        for i, desc in enumerate(job_descriptions):
-            job_skills = self.extract_skills(desc)
-            if not job_skills:
-                keyword_match = semantic_scores[i]
-            else:
-                common = set(cv_skills).intersection(set(job_skills))
-                keyword_match = len(common) / len(job_skills)
-            
-            hybrid = (semantic_scores[i] * 0.6) + (keyword_match * 0.4)
-            final_scores.append(round(hybrid * 100, 1))
-        return final_scores
+        with METRICS.stage("extract_skills", items=1) as m:
+            key = "skills:" + content_hash(text)
+            skills = self.cache.get(key)
+            m["cache_hit"] = skills is not None
+            if skills is None:
+                skills = sorted(SKILL_MATCHER.find(text), key=SKILL_INDEX.get)
+                self.cache.put(key, skills)
+        return list(skills)
+
+    def extract_skills_batch(self, texts):
+        with METRICS.stage("extract_skills_batch", items=len(texts)):
+            return SKILL_MATCHER.find_batch(texts)
+
+    def encode_cv(self, cv_text):
+        with METRICS.stage("encode_cv", items=1) as m:
+            key = f"emb:{self.model.name}:" + content_hash(cv_text)
+            emb = self.cache.get(key)
+            m["cache_hit"] = emb is not None
+            if emb is None:
+                emb = self.model.encode(cv_text, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+                self.cache.put(key, emb)
+        return emb
+
+    def encode_cvs(self, cv_texts):
+        """Эмбеддинги нескольких CV: все ещё не закэшированные кодируются одним батчем."""
+        with METRICS.stage("encode_cvs", items=len(cv_texts)) as m:
+            keys = [f"emb:{self.model.name}:" + content_hash(t) for t in cv_texts]
+            embs = {k: self.cache.get(k) for k in keys}
+            todo = {k: t for k, t in zip(keys, cv_texts) if embs[k] is None}
+            m["encoded"] = len(todo)
+            if todo:
+                new = self.model.encode(list(todo.values()), normalize_embeddings=True, convert_to_numpy=True)
+                for k, emb in zip(todo, np.asarray(new, dtype=np.float32)):
+                    embs[k] = emb
+                    self.cache.put(k, emb)
+        return [embs[k] for k in keys]
+
+    def job_rows(self, df):
+        """
+        Строки индекса эмбеддингов для вакансий df. Берём emb_row из хранилища, если он
+        совпадает по хэшу; остальные описания докодируются и дописываются в индекс.
+        """
+        with METRICS.stage("job_rows", items=len(df)) as m:
+            return self._job_rows(df, m)
+
+    def _job_rows(self, df, m):
+        # Строки должны соответствовать тому же состоянию индекса, из которого потом берутся векторы
+        with self.index.lock: return self._index_rows(df, m)
+
+    def _index_rows(self, df, m):
+        self.index.refresh()
+        hashes = df['content_hash'].to_numpy(dtype=object) if 'content_hash' in df else np.array([content_hash(d) for d in df['description']], dtype=object)
+        rows = df['emb_row'].to_numpy(dtype=np.int64, copy=True) if 'emb_row' in df else np.full(len(df), -1, dtype=np.int64)
+        ok = (rows >= 0) & (rows < len(self.index))
+        ok[ok] = self.index.hash_array[rows[ok]] == hashes[ok]
+        m["encoded"] = int((~ok).sum())
+        if not ok.all():
+            self.index.update(self.job_encoder, df['description'].to_numpy()[~ok])
+            rows[~ok] = [self.index.rows[h] for h in hashes[~ok]]
+        return rows
+
+    def job_vectors(self, df):
+        with self.index.lock: return CompactVectors.take(self.index.vectors, self.job_rows(df), self.precision)
+
+    def retriever(self, df, mode='auto'):
+        """JobRetriever над эмбеддингами вакансий; пересоздаётся только при смене базы или режима."""
+        if mode == 'auto': mode = 'ivf' if len(df) >= IVF_MIN_JOBS else 'exact'
+        with self.index.lock:
+            rows = self.job_rows(df)
+            # Строки индекса у разных энкодеров совпадают — сохранённый IVF различаем по имени энкодера
+            fingerprint = content_hash(self.job_encoder.name.encode("utf-8") + rows.tobytes())
+            r = self._retriever
+            if r is None or r.mode != mode or r.fingerprint != fingerprint or r.precision != self.precision:
+                with METRICS.stage("build_retriever", items=len(rows), mode=mode, precision=self.precision):
+                    r = self._retriever = JobRetriever(CompactVectors.take(self.index.vectors, rows, self.precision), mode=mode, fingerprint=fingerprint, precision=self.precision)
+        return r
+
+    def db_view(self, df):
+        """(версия, матрица навыков, коды городов, {город: код}, маска Active) — общие для всех CV, пересчёт при смене базы."""
+        version = db_version(df)
+        if self._db is None or self._db[0] != version:
+            with METRICS.stage("db_view", items=len(df)):
+                job_skills = skill_matrix(df['skills'] if 'skills' in df else self.extract_skills_batch(df['description']))
+                codes, locations = pd.factorize(df['Location'].astype(str))
+                self._db = (version, job_skills, codes, {loc: i for i, loc in enumerate(locations)}, (df['filter_status'] == 'Active').to_numpy())
+        return self._db
+
+    def score_all(self, cv_text, cv_skills, df):
+        """(скоры, матрица недостающих навыков) CV по всей базе; кэш на (CV, навыки CV, версия базы)."""
+        return self.score_many([cv_text], [cv_skills], df)[0]
+
+    def score_many(self, cv_texts, cv_skills, df):
+        """score_all для нескольких CV: некэшированные считаются одним умножением (вакансии × CV)."""
+        version, job_skills = self.db_view(df)[:2]
+        keys = [f"scores:{self.job_encoder.name}:{self.precision}:{content_hash(t)}:{content_hash('|'.join(s))}:{version}" for t, s in zip(cv_texts, cv_skills)]
+        with METRICS.stage("score_all", items=len(df) * len(keys)) as m:
+            results = [self.results.get(key) for key in keys]
+            todo = [i for i, r in enumerate(results) if r is None]
+            m["cache_hit"] = not todo
+            if todo:
+                cv_embs = np.stack(self.encode_cvs([cv_texts[i] for i in todo]))
+                cv_vecs = np.stack([skill_vector(cv_skills[i]) for i in todo], axis=1)
+                scores = score_matrix(self.retriever(df, mode='exact').vectors, job_skills, cv_embs, cv_vecs)
+                for j, i in enumerate(todo):
+                    gaps = (job_skills @ sparse.diags(1 - cv_vecs[:, j])).tocsr()
+                    gaps.eliminate_zeros()
+                    gaps.sort_indices()
+                    results[i] = (np.ascontiguousarray(scores[:, j]), gaps)
+                    self.results.put(keys[i], results[i])
+        return results
+
+    def filter_mask(self, df, location=None, include_traps=True):
+        """prefilter_mask по готовым кодам городов и маске Active: без строковых сравнений по базе."""
+        _, _, codes, locations, active = self.db_view(df)
+        mask = np.ones(len(df), dtype=bool) if location in (None, "All Locations") else codes == locations.get(location, -1)
+        return mask if include_traps else mask & active
+
+    def search_jobs(self, cv_text, cv_skills, df, top_k=100, location=None, include_traps=True):
+        """
+        Гибридный скор по всей базе считается один раз на CV (score_all), город и ловушки —
+        булевы маски поверх закэшированных массивов. Возвращает top_k Active-строк df (и до top_k ловушек
+        после них при include_traps) с колонками Score и Missing.
+        """
+        if df.empty: return df.assign(Score=[], Missing=[])
+        return self.top_jobs(self.score_all(cv_text, cv_skills, df), df, top_k, location, include_traps)
+
+    def top_jobs(self, scored, df, top_k=100, location=None, include_traps=True):
+        """
+        top_k Active-вакансий по готовому результату score_all/score_many (с колонками Score и Missing),
+        при include_traps за ними — до top_k лучших ловушек: ловушки не занимают места хороших вакансий.
+        """
+        scores, gaps = scored
+        with METRICS.stage("filter", items=len(df)) as m:
+            mask = self.filter_mask(df, location, include_traps=False)
+            cand = masked_top_k(scores, mask, top_k)
+            if include_traps:
+                traps = self.filter_mask(df, location) & ~mask
+                cand = np.concatenate([cand, masked_top_k(scores, traps, top_k)])
+                mask |= traps
+            m["kept"] = int(mask.sum())
+        result = df.iloc[cand].copy()
+        result['Score'] = scores[cand].tolist()
+        result['Missing'] = skill_lists(gaps[cand])
+        return result
+
+    def calculate_hybrid_score(self, cv_text, job_descriptions, cv_skills, job_skills=None, cv_emb=None, job_embs=None):
+        """
+        Возвращает (scores, missing): скор каждой вакансии и список недостающих навыков.
+        job_skills — готовая матрица skill_matrix() или списки навыков; иначе извлекаются здесь.
+        """
+        with METRICS.stage("calculate_hybrid_score", items=len(job_descriptions)):
+            return self._hybrid_score(cv_text, job_descriptions, cv_skills, job_skills, cv_emb, job_embs)
+
+    def _hybrid_score(self, cv_text, job_descriptions, cv_skills, job_skills, cv_emb, job_embs):
+        if job_skills is None: job_skills = self.extract_skills_batch(job_descriptions)
+        if not sparse.issparse(job_skills): job_skills = skill_matrix(job_skills)
+
+        if cv_emb is None: cv_emb = self.encode_cv(cv_text)
+        if job_embs is None: job_embs = self.index.lookup(self.job_encoder, job_descriptions)
+        semantic = job_embs @ cv_emb
+
+        # Доля навыков вакансии, которые есть в CV; без навыков — берём семантику
+        cv_vec = skill_vector(cv_skills)
+        totals = np.diff(job_skills.indptr)
+        common = job_skills @ cv_vec
+        final_scores = hybrid_score(semantic, common, totals).tolist()
+        return final_scores, missing_skills(job_skills, cv_vec)
 
     def analyze_gaps(self, cv_skills, job_text):
         job_skills = set(self.extract_skills(job_text))
         return list(job_skills - set(cv_skills))
 
 # === ЛОГИКА "ДЕТЕКТОРА ЛОВУШЕК" ===
+SENIOR_KEYWORDS = ['senior', 'sr.', 'lead', 'principal', 'manager', 'head', 'director', 'iii', 'iv']
+
+# Правила: (имя, колонка, regex без учёта регистра, статус). Чем выше в списке, тем выше приоритет:
+# вакансия получает статус первого сработавшего правила. Новое правило = новая строка здесь.
+TRAP_RULES = [
+    ("senior_title", "title", '|'.join(SENIOR_KEYWORDS), '⛔ Senior Role'),
+    ("experience_3plus", "description", r'(?:[3-9]|\d{2,})\+?\s*-?\s*years?', '⚠️ Fake Junior (3+ years exp)'),
+]
+
+class TrapRuleSet:
+    """
+    Компилирует TRAP_RULES в векторные pandas str-операции: на каждую колонку одно объединённое
+    выражение отсекает чистые строки, отдельные правила проверяются только на оставшихся.
+    Считает срабатывания и время по каждому правилу: stats — за последний вызов evaluate, totals — за весь процесс.
+    version меняется при любой правке правил.
+    """
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.version = content_hash(repr(self.rules))[:12]
+        columns = {}
+        for name, column, pattern, status in self.rules: columns.setdefault(column, []).append(f'(?:{pattern})')
+        self.combined = {column: re.compile('|'.join(p), re.IGNORECASE) for column, p in columns.items()}
+        self.compiled = [(name, column, re.compile(pattern, re.IGNORECASE), status) for name, column, pattern, status in self.rules]
+        self.stats = self._empty_stats()
+        self.totals = self._empty_stats()
+
+    def _empty_stats(self): return {name: {"checked": 0, "hits": 0, "seconds": 0.0} for name, *_ in self.rules}
+
+    def evaluate(self, df):
+        """Массив статусов для строк df ('Active', если ни одно правило не сработало)."""
+        status = np.full(len(df), 'Active', dtype=object)
+        stats = self._empty_stats()
+        if not len(df):
+            self.stats = stats
+            return status
+        texts = {column: df[column].astype(str) for column in self.combined}
+        candidates = {column: texts[column].str.contains(pattern, regex=True).to_numpy(dtype=bool) for column, pattern in self.combined.items()}
+        for name, column, pattern, rule_status in self.compiled:
+            t0 = time.perf_counter()
+            rows = np.flatnonzero(candidates[column] & (status == 'Active'))
+            hit = rows[texts[column].iloc[rows].str.contains(pattern, regex=True).to_numpy(dtype=bool)] if len(rows) else rows
+            status[hit] = rule_status
+            stats[name] = {"checked": len(rows), "hits": len(hit), "seconds": time.perf_counter() - t0}
+        for name, stat in stats.items():
+            for key, value in stat.items(): self.totals[name][key] += value
+        self.stats = stats
+        return status
+
+    def report(self, totals=False):
+        """Строки отчёта по правилам: за последний вызов evaluate или (totals=True) за весь процесс."""
+        stats = self.totals if totals else self.stats
+        return [f"   {name}: {s['hits']} hits / {s['checked']} checked, {s['seconds'] * 1000:.1f} ms" for name, s in stats.items()]
+
+TRAP_RULESET = TrapRuleSet(TRAP_RULES)
+
 def tag_jobs(df):
     """
     Вместо удаления, мы помечаем плохие вакансии статусом.
     """
-    df['filter_status'] = 'Active' # По умолчанию все хорошие
-    
-    # 1. Помечаем Senior позиции
-    senior_keywords = ['senior', 'sr.', 'lead', 'principal', 'manager', 'head', 'director', 'iii', 'iv']
-    pattern = '|'.join(senior_keywords)
-    mask_senior = df['title'].str.lower().str.contains(pattern, case=False)
-    df.loc[mask_senior, 'filter_status'] = '⛔ Senior Role'
-
-    # 2. Помечаем Fake Juniors (3+ years experience)
-    high_exp_pattern = r'([3-9]|\d{2,})\+?\s*-?\s*years?'
-    def is_fake(desc):
-        return bool(re.search(high_exp_pattern, str(desc).lower()))
-    
-    mask_fake = df['description'].apply(is_fake)
-    # Помечаем только если это еще не Senior (чтобы не перезаписать)
-    df.loc[mask_fake & (df['filter_status'] == 'Active'), 'filter_status'] = '⚠️ Fake Junior (3+ years exp)'
-    
+    df['filter_status'] = TRAP_RULESET.evaluate(df)
+    df['rules_version'] = TRAP_RULESET.version
     return df
 
-def load_real_db():
-    df = pd.DataFrame()
-    if os.path.exists("live_jobs.csv"):
-        try: df = pd.read_csv("live_jobs.csv")
-        except: pass
-        
-    if df.empty: return pd.DataFrame()
+def retag_stale(df):
+    # Правила поменялись после записи в хранилище — перепроверяем только устаревшие строки
+    if not {'title', 'description', 'rules_version'}.issubset(df.columns): return df
+    stale = (df['rules_version'] != TRAP_RULESET.version).to_numpy()
+    if stale.any():
+        df.loc[stale, 'filter_status'] = TRAP_RULESET.evaluate(df[stale])
+        df.loc[stale, 'rules_version'] = TRAP_RULESET.version
+        print(f"🔁 Retagged {stale.sum()} jobs with updated trap rules")
+    return df
 
-    df = df.dropna(subset=['description', 'title'])
-    
-    # Применяем разметку (Тэгирование)
-    df = tag_jobs(df)
+# === АГРЕГАТЫ РЫНКА (Market Insights) ===
+SENIOR_STATUS = next(status for name, _, _, status in TRAP_RULES if name == "senior_title")
+
+class MarketStats:
+    """
+    Готовые агрегаты для Market Insights: частота навыков всего и по Location, совместная
+    встречаемость навыков, статусы вакансий по компаниям. Дополняются при каждом JobStore.append,
+    статусы пересчитываются при смене правил ловушек. Приложение читает только эти числа.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.loaded, self._mtime = False, None
+        self.reset()
+        self.load()
+
+    def reset(self):
+        n = len(TECH_KEYWORDS)
+        self.n_jobs = 0
+        self.rules_version = TRAP_RULESET.version
+        self.skill_total = np.zeros(n, dtype=np.int64)
+        self.cooccurrence = np.zeros((n, n), dtype=np.int64)
+        self.by_location = {}  # Location -> (вакансий, счётчики навыков)
+        self.companies = {}  # компания -> {статус: вакансий}
+
+    def add(self, df):
+        """Учитывает новые вакансии (нужны skills, Location, company, filter_status)."""
+        if df.empty: return
+        m = skill_matrix(df['skills'])
+        self.n_jobs += len(df)
+        self.skill_total += np.asarray(m.sum(axis=0), dtype=np.int64).ravel()
+        self.cooccurrence += (m.T @ m).toarray().astype(np.int64)
+        codes, locations = pd.factorize(df['Location'].fillna("Unknown").astype(str))
+        by_loc = (sparse.csr_matrix((np.ones(len(df), dtype=np.float32), (codes, np.arange(len(df)))), shape=(len(locations), len(df))) @ m).toarray()
+        jobs = np.bincount(codes, minlength=len(locations))
+        for i, loc in enumerate(locations):
+            n, counts = self.by_location.get(loc, (0, 0))
+            self.by_location[loc] = (n + int(jobs[i]), counts + by_loc[i].astype(np.int64))
+        self._add_statuses(df)
+
+    def _add_statuses(self, df):
+        for (company, status), n in df.groupby([df['company'].fillna("Unknown").astype(str), 'filter_status']).size().items():
+            statuses = self.companies.setdefault(company, {})
+            statuses[status] = statuses.get(status, 0) + int(n)
+
+    def set_statuses(self, df):
+        """Правила ловушек поменялись: статусы по компаниям пересчитываются по всей перетегированной базе."""
+        self.companies = {}
+        self._add_statuses(df)
+        self.rules_version = TRAP_RULESET.version
+
+    def rebuild(self, store):
+        store.upgrade()
+        df = store.load(['title', 'company', 'description', 'Location', 'skills', 'filter_status', 'rules_version', 'content_hash', 'canonical'])
+        self.reset()
+        self.add(retag_stale(df[df['canonical'] == df['content_hash']]))
+        self.save()
+
+    def save(self):
+        data = {"skills": TECH_KEYWORDS, "n_jobs": self.n_jobs, "rules_version": self.rules_version,
+                "skill_total": self.skill_total.tolist(), "cooccurrence": self.cooccurrence.tolist(),
+                "by_location": {loc: [n, counts.tolist()] for loc, (n, counts) in self.by_location.items()},
+                "companies": self.companies}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+        self.loaded, self._mtime = True, os.path.getmtime(self.path)
+
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, encoding="utf-8") as f: data = json.load(f)
+        except Exception as e: return print(f"⚠️ Market stats unreadable, rebuilding: {e}")
+        # Словарь навыков поменялся — счётчики не сопоставить, пересобираем
+        if data.get("skills") != TECH_KEYWORDS: return
+        self.n_jobs, self.rules_version = data["n_jobs"], data["rules_version"]
+        self.skill_total = np.array(data["skill_total"], dtype=np.int64)
+        self.cooccurrence = np.array(data["cooccurrence"], dtype=np.int64)
+        self.by_location = {loc: (n, np.array(counts, dtype=np.int64)) for loc, (n, counts) in data["by_location"].items()}
+        self.companies = data["companies"]
+        self.loaded, self._mtime = True, os.path.getmtime(self.path)
+
+    @contextmanager
+    def locked(self):
+        """
+        Изменение агрегатов под межпроцессной блокировкой: сначала подтягиваются чужие приращения,
+        на выходе всё сохраняется. Иначе второй писатель затёр бы счётчики первого.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with file_lock(self.path + ".lock"):
+            self.load()
+            yield self
+            self.save()
+
+    def refresh(self):
+        # Ингест мог обновить агрегаты из другого процесса
+        if os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime: self.load()
+
+    def top_skills(self, n=15, location=None):
+        """[(навык, вакансий)] по убыванию; location=None — по всему рынку."""
+        counts = self.skill_total
+        if location not in (None, "All Locations"): counts = self.by_location.get(location, (0, np.zeros_like(counts)))[1]
+        return [(SKILL_NAMES[i], int(counts[i])) for i in top_k(counts, n) if counts[i] > 0]
+
+    def cooccurring(self, skills):
+        """Матрица совместной встречаемости для списка навыков (диагональ — частота самого навыка)."""
+        idx = [SKILL_INDEX[s] for s in skills]
+        return pd.DataFrame(self.cooccurrence[np.ix_(idx, idx)], index=skills, columns=skills)
+
+    def company_rates(self, min_jobs=1):
+        """Доля ловушек (любой статус кроме Active) и senior-ролей по компаниям."""
+        rows = []
+        for company, statuses in self.companies.items():
+            jobs = sum(statuses.values())
+            if jobs < min_jobs: continue
+            rows.append({"company": company, "jobs": jobs, "trap_rate": 1 - statuses.get('Active', 0) / jobs,
+                         "senior_rate": statuses.get(SENIOR_STATUS, 0) / jobs})
+        if not rows: return pd.DataFrame(columns=["company", "jobs", "trap_rate", "senior_rate"])
+        return pd.DataFrame(rows).sort_values(["jobs", "company"], ascending=[False, True], ignore_index=True)
+
+# === ПОЧТИ-ДУБЛИКАТЫ (MinHash + LSH) ===
+_PERM_RNG = np.random.default_rng(20240611)
+_PERM_A = _PERM_RNG.integers(1, 2**32, DEDUP_PERM, dtype=np.uint64)
+_PERM_B = _PERM_RNG.integers(0, 2**32, DEDUP_PERM, dtype=np.uint64)
+_BAND_MUL = _PERM_RNG.integers(1, 2**63, DEDUP_PERM // DEDUP_BANDS, dtype=np.uint64) | np.uint64(1)
+_MERSENNE = np.uint64((1 << 61) - 1)
+
+def minhash(texts, shingle=3):
+    """MinHash-подписи (len(texts), DEDUP_PERM) uint32 по шинглам из shingle слов."""
+    out = np.empty((len(texts), DEDUP_PERM), dtype=np.uint32)
+    for i, text in enumerate(texts):
+        words = np.array([zlib.crc32(w.encode()) for w in _clean_text(str(text)).split()] or [0], dtype=np.uint64)
+        n = max(len(words) - shingle + 1, 1)
+        h = np.zeros(n, dtype=np.uint64)
+        for j in range(min(shingle, len(words))): h = h * np.uint64(1000003) + words[j:j + n]
+        h &= np.uint64(0xFFFFFFFF)  # a * h + b не переполняет uint64
+        out[i] = ((h[:, None] * _PERM_A + _PERM_B) % _MERSENNE).min(axis=0) & np.uint64(0xFFFFFFFF)
+    return out
+
+def _band_keys(signatures):
+    # Полоса из DEDUP_PERM // DEDUP_BANDS (8) значений подписи -> один uint64 (переполнение при умножении намеренное)
+    bands = signatures.reshape(len(signatures), DEDUP_BANDS, DEDUP_PERM // DEDUP_BANDS).astype(np.uint64)
+    return (bands * _BAND_MUL).sum(axis=2, dtype=np.uint64)
+
+def _title_words(title): return frozenset(_clean_text(str(title)).split())
+
+def _place(company, location):
+    # Один текст у разных компаний или городов — разные вакансии (сеть филиалов, агентство), не перепост
+    return tuple(" ".join(_clean_text("" if pd.isna(v) else str(v)).split()) for v in (company, location))
+
+# "Junior" и "Senior" с одним текстом — разные вакансии (вторая — ловушка), такие заголовки не склеиваются
+_LEVEL_WORDS = _title_words(" ".join(SENIOR_KEYWORDS + ['junior', 'intern', 'internship', 'graduate', 'entry', 'trainee', 'student']))
+
+class NearDupIndex:
+    """
+    LSH-индекс канонических вакансий: MinHash описания режется на DEDUP_BANDS полос, вакансии
+    с совпавшей полосой — кандидаты, перепост подтверждается оценкой Жаккара, словами заголовка
+    и совпадением компании и Location.
+    Поиск — бинарный поиск по отсортированным ключам полос (плюс словарь для добавленных после сборки),
+    так что новая вакансия проверяется за O(полос · log n), а не сравнением со всей базой.
+    Дубликаты в индекс не попадают: бакеты не разрастаются от сотен перепостов одного объявления.
+    """
+    def __init__(self, hashes=(), titles=(), companies=(), locations=(), signatures=None):
+        self.hashes = list(hashes)
+        self.titles = [_title_words(t) for t in titles]
+        self.places = [_place(c, loc) for c, loc in zip(companies, locations)]
+        self._sigs = np.zeros((0, DEDUP_PERM), dtype=np.uint32) if signatures is None else signatures
+        keys = _band_keys(self._sigs)
+        self._order = np.argsort(keys, axis=0, kind='stable')
+        self._sorted = np.take_along_axis(keys, self._order, axis=0)
+        self._recent = {}  # (полоса, ключ) -> строки, добавленные после сборки
+
+    def __len__(self): return len(self.hashes)
+
+    def candidates(self, keys):
+        rows = set()
+        for band, key in enumerate(keys):
+            column = self._sorted[:, band]
+            lo, hi = np.searchsorted(column, key, 'left'), np.searchsorted(column, key, 'right')
+            rows.update(self._order[lo:hi, band].tolist())
+            rows.update(self._recent.get((band, int(key)), ()))
+        return rows
+
+    def match(self, signature, title, place, keys):
+        """Строка канонической вакансии, перепостом которой является эта, или None."""
+        rows = np.fromiter(self.candidates(keys), dtype=np.int64)
+        sims = (self._sigs[rows] == signature).mean(axis=1)
+        for i in rows[np.argsort(-sims, kind='stable')][:np.sum(sims >= DEDUP_THRESHOLD)]:
+            if self.places[i] != place: continue
+            other = self.titles[i]
+            if len(title & other) >= DEDUP_TITLE_THRESHOLD * len(title | other) and not (title ^ other) & _LEVEL_WORDS: return int(i)
+        return None
+
+    def add(self, content_hash, title, place, signature, keys):
+        i = len(self.hashes)
+        if i == len(self._sigs):  # запас по ёмкости: подписи лежат одним массивом для векторной проверки кандидатов
+            grown = np.zeros((max(2 * i, 1024), DEDUP_PERM), dtype=np.uint32)
+            grown[:i] = self._sigs[:i]
+            self._sigs = grown
+        self._sigs[i] = signature
+        self.hashes.append(content_hash)
+        self.titles.append(title)
+        self.places.append(place)
+        for band, key in enumerate(keys): self._recent.setdefault((band, int(key)), []).append(i)
+
+    def assign(self, hashes, titles, companies, locations, signatures):
+        """
+        content_hash канонической вакансии для каждой новой (свой — если похожих нет, тогда она
+        сама становится канонической). Дубликаты внутри пачки тоже находятся: строки идут по порядку.
+        """
+        canonical = []
+        for h, title, company, location, signature, keys in zip(hashes, titles, companies, locations, signatures, _band_keys(signatures)):
+            title, place = _title_words(title), _place(company, location)
+            i = self.match(signature, title, place, keys)
+            if i is None: self.add(h, title, place, signature, keys)
+            canonical.append(h if i is None else self.hashes[i])
+        return canonical
+
+# === КОЛОНОЧНОЕ ХРАНИЛИЩЕ ВАКАНСИЙ ===
+class JobStore:
+    """
+    Вакансии в папке Parquet-частей вместе с производными колонками:
+    filter_status, skills, emb_row (строка в индексе эмбеддингов), content_hash описания,
+    minhash (MinHash-подпись) и canonical (content_hash вакансии, перепостом которой является строка).
+    Добавление дописывает новую часть только с ещё не виденными content_hash.
+    Всё, что пишет или удаляет части (append, compact, upgrade, retag), идёт под блокировкой <path>/.lock.
+    """
+    COLUMNS = ['title', 'company', 'description', 'Location', 'url', 'source', 'filter_status', 'rules_version', 'skills', 'emb_row',
+               'content_hash', 'minhash', 'canonical']
+
+    def __init__(self, path=JOB_STORE_DIR):
+        self.path = path
+        self._hashes, self._hashes_parts = None, None
+        self._dedup, self._dedup_parts = None, None
+        self._market = None
+        self._lock, self._depth = threading.RLock(), 0
+
+    @contextmanager
+    def locked(self):
+        """Межпроцессная блокировка хранилища; повторный вход (append -> compact, upgrade -> rebuild) не блокирует."""
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth > 1: yield
+                else:
+                    os.makedirs(self.path, exist_ok=True)
+                    with file_lock(os.path.join(self.path, ".lock")): yield
+            finally: self._depth -= 1
+
+    @property
+    def market(self):
+        """MarketStats хранилища; для хранилища без агрегатов они один раз собираются по всем вакансиям."""
+        if self._market is None:
+            self._market = MarketStats(os.path.join(self.path, MARKET_STATS_FILE))
+            if not self._market.loaded and self.exists(): self._market.rebuild(self)
+        return self._market
+
+    @property
+    def dedup(self):
+        """NearDupIndex канонических вакансий; пересобирается, если другой процесс дописал части."""
+        parts = self.parts()
+        if self._dedup is None or parts != self._dedup_parts:
+            self.upgrade()
+            df = self.load(['content_hash', 'title', 'company', 'Location', 'minhash', 'canonical'])
+            df = df[df['canonical'] == df['content_hash']]
+            signatures = np.frombuffer(b"".join(df['minhash']), dtype=np.uint32).reshape(len(df), DEDUP_PERM)
+            self._dedup, self._dedup_parts = NearDupIndex(df['content_hash'], df['title'], df['company'], df['Location'], signatures), self.parts()
+        return self._dedup
+
+    def upgrade(self):
+        """
+        Части, записанные до поиска почти-дубликатов: считаем minhash и canonical по всем вакансиям
+        в порядке добавления и переписываем хранилище одной частью. Агрегаты рынка пересобираются без перепостов.
+        """
+        if self._upgraded(): return
+        with self.locked():
+            # Другой процесс мог обновить хранилище, пока ждали блокировку
+            if self._upgraded(): return
+            self._upgrade()
+
+    def _upgraded(self):
+        import pyarrow.parquet as pq
+        try: return all('canonical' in pq.read_schema(p).names for p in self.parts())
+        except FileNotFoundError: return False  # часть убрал параллельный compact — проверяем под блокировкой
+
+    def _upgrade(self):
+        parts = self.parts()
+        df = self.fill_columns(self._read(parts))
+        signatures = minhash(df['description'].tolist())
+        df['minhash'] = [s.tobytes() for s in signatures]
+        df['canonical'] = NearDupIndex().assign(df['content_hash'], df['title'], df['company'], df['Location'], signatures)
+        merged = os.path.join(self.path, f"part-{time.time_ns()}.parquet")
+        df[self.COLUMNS].to_parquet(merged + ".tmp", index=False)
+        os.replace(merged + ".tmp", merged)
+        for p in parts: os.remove(p)
+        print(f"🧬 Linked {(df['canonical'] != df['content_hash']).sum()} near-duplicate jobs in the existing store")
+        self._hashes_parts = self._dedup_parts = None
+        self._market = MarketStats(os.path.join(self.path, MARKET_STATS_FILE))
+        self._market.rebuild(self)
+
+    def fill_columns(self, df):
+        """Досчитывает производные колонки, которых нет в частях старых версий (rules_version, skills, ...)."""
+        for col in self.COLUMNS:
+            if col not in df: df[col] = None
+        if df['content_hash'].isna().any(): df['content_hash'] = [content_hash(d) for d in df['description']]
+        df = retag_stale(df)
+        missing = df['skills'].isna().to_numpy()
+        if missing.any(): df.loc[missing, 'skills'] = pd.Series([sorted(s, key=SKILL_INDEX.get) for s in SKILL_MATCHER.find_batch(df.loc[missing, 'description'])], index=df.index[missing], dtype=object)
+        df['emb_row'] = df['emb_row'].fillna(-1).astype(np.int64)
+        return df
+
+    def retag(self):
+        """
+        Правила ловушек поменялись: устаревшие части перетегируются и переписываются на месте один раз,
+        статусы по компаниям в агрегатах пересчитываются. Дальше загрузка снова только читает. Возвращает число строк.
+        """
+        retagged = 0
+        try: stale_parts = self._stale_parts()
+        except FileNotFoundError: stale_parts = None  # часть убрал параллельный compact — проверяем под блокировкой
+        if stale_parts != []:
+            with self.locked():
+                for p in self._stale_parts():
+                    df = pd.read_parquet(p)
+                    if 'rules_version' not in df: df['rules_version'] = None
+                    stale = (df['rules_version'] != TRAP_RULESET.version).to_numpy()
+                    df.loc[stale, 'filter_status'] = TRAP_RULESET.evaluate(df[stale])
+                    df.loc[stale, 'rules_version'] = TRAP_RULESET.version
+                    df.to_parquet(f"{p}.{os.getpid()}.tmp", index=False)
+                    os.replace(f"{p}.{os.getpid()}.tmp", p)
+                    retagged += int(stale.sum())
+        if retagged: print(f"🔁 Retagged {retagged} jobs with updated trap rules (saved to the store)")
+        if self.exists() and self.market.rules_version != TRAP_RULESET.version:
+            with self.market.locked() as market:
+                if market.rules_version != TRAP_RULESET.version:
+                    df = self.load(['company', 'filter_status', 'content_hash', 'canonical'])
+                    market.set_statuses(df[df['canonical'] == df['content_hash']])
+        return retagged
+
+    def _stale_parts(self):
+        import pyarrow.parquet as pq
+        return [p for p in self.parts()
+                if not ('rules_version' in pq.read_schema(p).names and (pd.read_parquet(p, columns=['rules_version'])['rules_version'] == TRAP_RULESET.version).all())]
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def exists(self): return bool(self.parts())
+
+    def load(self, columns=None):
+        return self._read(self.parts(), columns)
+
+    def _read(self, parts, columns=None):
+        if not parts: return pd.DataFrame(columns=columns or self.COLUMNS)
+        return pd.concat([pd.read_parquet(p, columns=columns) for p in parts], ignore_index=True)
+
+    def hashes(self):
+        # Читаем только колонку content_hash; пересчитываем, если появились новые части
+        parts = self.parts()
+        if parts != self._hashes_parts:
+            self._hashes = set(self.load(['content_hash'])['content_hash']) if parts else set()
+            self._hashes_parts = parts
+        return self._hashes
+
+    def append(self, df, engine=None):
+        """Добавляет новые вакансии (дубликаты по описанию отбрасываются). Возвращает число добавленных."""
+        df = df.dropna(subset=['description', 'title']).copy()
+        for col in ['company', 'Location', 'url', 'source']:
+            if col not in df: df[col] = None
+        df['content_hash'] = [content_hash(d) for d in df['description']]
+        df = df.drop_duplicates('content_hash')
+        df = df[~df['content_hash'].isin(self.hashes())]
+        if df.empty: return 0
+        with self.locked():
+            # Другой процесс мог дописать те же вакансии, пока ждали блокировку
+            df = df[~df['content_hash'].isin(self.hashes())].reset_index(drop=True)
+            if df.empty: return 0
+            return self._append(df, engine)
+
+    def _append(self, df, engine):
+        market, dedup = self.market, self.dedup  # до записи части, иначе пересборка посчитает эти строки дважды
+
+        # Перепосты (MinHash + LSH) ссылаются на каноническую вакансию; эмбеддинги и агрегаты — только у канонических
+        signatures = minhash(df['description'].tolist())
+        df['minhash'] = [s.tobytes() for s in signatures]
+        df['canonical'] = dedup.assign(df['content_hash'], df['title'], df['company'], df['Location'], signatures)
+        canonical = (df['canonical'] == df['content_hash']).to_numpy()
+        if not canonical.all(): print(f"🧬 {(~canonical).sum()} of {len(df)} new jobs are near-duplicates of known postings")
+
+        # Производные колонки считаются один раз здесь, а не при каждой загрузке
+        df = tag_jobs(df)
+        print(f"🕵️ Tagged {len(df)} new jobs (trap rules {TRAP_RULESET.version}):\n" + "\n".join(TRAP_RULESET.report()))
+        df['skills'] = [sorted(s, key=SKILL_INDEX.get) for s in SKILL_MATCHER.find_batch(df['description'])]
+        df['emb_row'] = -1
+        if engine is not None and canonical.any(): df.loc[canonical, 'emb_row'] = engine.job_rows(df[canonical])
+
+        df[self.COLUMNS].to_parquet(os.path.join(self.path, f"part-{time.time_ns()}.parquet"), index=False)
+        with market.locked(): market.add(df[canonical])
+        self._hashes.update(df['content_hash'])
+        self._hashes_parts = self._dedup_parts = self.parts()
+        if len(self._hashes_parts) > JOB_STORE_MAX_PARTS: self.compact()
+        return len(df)
+
+    def duplicates(self, canonical_hash):
+        """Перепосты канонической вакансии (без неё самой)."""
+        df = self.load(['title', 'company', 'Location', 'url', 'source', 'content_hash', 'canonical'])
+        return df[(df['canonical'] == canonical_hash) & (df['content_hash'] != canonical_hash)].reset_index(drop=True)
+
+    def compact(self):
+        with self.locked():
+            # Склеиваем ровно те части, что удаляем: чужая часть, дописанная между шагами, не задвоится
+            parts = self.parts()
+            if len(parts) < 2: return
+            merged = os.path.join(self.path, f"part-{time.time_ns()}.parquet")
+            self._read(parts).to_parquet(merged + ".tmp", index=False)
+            os.replace(merged + ".tmp", merged)
+            for p in parts: os.remove(p)
+            self._hashes_parts = self._dedup_parts = self.parts()
+
+def collapse_duplicates(df):
+    """Оставляет канонические вакансии; duplicates — сколько перепостов на них ссылается (сами они в JobStore.duplicates)."""
+    keep = (df['canonical'] == df['content_hash']).to_numpy()
+    reposts = df.loc[~keep, 'canonical'].value_counts()
+    df = df[keep].reset_index(drop=True)
+    df['duplicates'] = df['content_hash'].map(reposts).fillna(0).astype(np.int64)
+    return df
+
+def load_real_db(columns=None, path=JOB_STORE_DIR, dedupe=True):
+    """
+    Вакансии из хранилища. dedupe=True — только канонические строки (перепосты схлопнуты, их число в duplicates);
+    columns=None — все колонки, кроме MinHash-подписей.
+    """
+    store = JobStore(path)
+    # Первый запуск: переносим live_jobs.csv в хранилище (дальше ингест дописывает туда)
+    if not store.exists() and os.path.exists(JOBS_CSV):
+        try: store.append(pd.read_csv(JOBS_CSV))
+        except Exception as e: print(f"⚠️ Could not import {JOBS_CSV}: {e}")
+    if store.exists():
+        store.upgrade()
+        store.retag()
+
+    load = [c for c in JobStore.COLUMNS if c != 'minhash'] if columns is None else list(columns)
+    if dedupe: load += [c for c in ('content_hash', 'canonical') if c not in load]
+    with METRICS.stage("load_real_db") as m:
+        df = retag_stale(store.load(load))
+        if dedupe: df = collapse_duplicates(df)[[c for c in load if columns is None or c in columns] + ['duplicates']]
+        m["items"] = len(df)
+    if df.empty: return pd.DataFrame()
     
     print(f"✅ Loaded {len(df)} jobs. Traps identified.")
     return df
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from core import LRUCache, content_hash
+
+MODELS = ['models/gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-pro']
+
+def build_prompt(cv_text, job_description, company_name, job_title):
+    return f"Write a 150-word cover letter. RESUME: {cv_text[:1000]}. JOB: {job_title} at {company_name}. DESC: {job_description[:1000]}. No placeholders."
+
+# === БЭКЕНДЫ ===
+class GeminiBackend:
+    # genai.configure глобальный на процесс, а бэкендов по одному на ключ пользователя: запросы
+    # с текущим ключом идут параллельно, другой ключ ждёт, пока они закончатся, и перенастраивает genai
+    _cond = threading.Condition()
+    _active_key, _in_flight, _waiting = None, 0, {}
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        self.genai, self.api_key = genai, api_key
+        self._models = {}
+
+    @contextmanager
+    def _configured(self):
+        cls = GeminiBackend
+        with cls._cond:
+            cls._waiting[self.api_key] = cls._waiting.get(self.api_key, 0) + 1
+            # Пока ждёт другой ключ, новые запросы текущего не пропускаются — иначе он может не дождаться
+            cls._cond.wait_for(lambda: cls._in_flight == 0 or (cls._active_key == self.api_key and len(cls._waiting) == 1))
+            cls._waiting[self.api_key] -= 1
+            if not cls._waiting[self.api_key]: del cls._waiting[self.api_key]
+            if cls._active_key != self.api_key:
+                self.genai.configure(api_key=self.api_key)
+                cls._active_key = self.api_key
+            cls._in_flight += 1
+        try: yield
+        finally:
+            with cls._cond:
+                cls._in_flight -= 1
+                cls._cond.notify_all()
+
+    def generate(self, model_name, prompt):
+        with self._configured():
+            if model_name not in self._models: self._models[model_name] = self.genai.GenerativeModel(model_name)
+            return self._models[model_name].generate_content(prompt).text
+
+class StubBackend:
+    """Офлайн-бэкенд: детерминированное письмо без сети. failing — модели, которые всегда падают."""
+    def __init__(self, failing=(), delay=0.0):
+        self.failing, self.delay = set(failing), delay
+        self.calls = []
+
+    def generate(self, model_name, prompt):
+        self.calls.append(model_name)
+        if self.delay: time.sleep(self.delay)
+        if model_name in self.failing: raise RuntimeError(f"{model_name} unavailable")
+        return f"Dear Hiring Manager,\n\n[{model_name} stub #{content_hash(prompt)[:8]}] {prompt[:200]}"
+
+def make_backend(api_key):
+    if os.environ.get("COVER_LETTER_BACKEND") == "stub": return StubBackend()
+    return GeminiBackend(api_key)
+
+# === CIRCUIT BREAKER ===
+class CircuitBreaker:
+    """После threshold ошибок подряд модель пропускается cooldown секунд, затем одна пробная попытка."""
+    def __init__(self, threshold=2, cooldown=300):
+        self.threshold, self.cooldown = threshold, cooldown
+        self.failures, self.opened_at = 0, None
+
+    def allow(self):
+        return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def success(self):
+        self.failures, self.opened_at = 0, None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold: self.opened_at = time.monotonic()
+
+# === СЕРВИС ГЕНЕРАЦИИ ===
+class CoverLetterService:
+    """
+    Генерация писем в пуле потоков: можно поставить в очередь письма для нескольких вакансий.
+    Готовые письма кэшируются по (хэш CV, хэш вакансии); модель, ответившая последней,
+    пробуется первой, а падающие модели отключаются через CircuitBreaker.
+    """
+    def __init__(self, backend, models=MODELS, workers=4, cache_mb=16, threshold=2, cooldown=300):
+        self.backend, self.models = backend, list(models)
+        self.breakers = {m: CircuitBreaker(threshold, cooldown) for m in self.models}
+        self.preferred = None
+        self.cache = LRUCache(cache_mb * 2**20)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(cv_text, job_description, company_name, job_title):
+        return "letter:" + content_hash(cv_text) + ":" + content_hash(f"{job_title}\n{company_name}\n{job_description}")
+
+    def _order(self):
+        with self._lock:
+            order = sorted(self.models, key=lambda m: m != self.preferred)
+            allowed = [m for m in order if self.breakers[m].allow()]
+        return allowed
+
+    def _generate(self, key, prompt):
+        try:
+            for model_name in self._order():
+                try:
+                    text = self.backend.generate(model_name, prompt)
+                except Exception as e:
+                    print(f"⚠️ {model_name} failed: {e}")
+                    with self._lock: self.breakers[model_name].failure()
+                    continue
+                with self._lock:
+                    self.breakers[model_name].success()
+                    self.preferred = model_name
+                if text:
+                    with self._lock: self.cache.put(key, text)
+                    return text
+            return "❌ AI error."
+        finally:
+            with self._lock: self._pending.pop(key, None)
+
+    def submit(self, cv_text, job_description, company_name, job_title):
+        """Future с текстом письма; повторный запрос той же пары CV/вакансия не уходит в API."""
+        key = self.key(cv_text, job_description, company_name, job_title)
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                done = Future()
+                done.set_result(cached)
+                return done
+            if key not in self._pending:
+                prompt = build_prompt(cv_text, job_description, company_name, job_title)
+                self._pending[key] = self._pool.submit(self._generate, key, prompt)
+            return self._pending[key]
+
+    def generate(self, cv_text, job_description, company_name, job_title):
+        return self.submit(cv_text, job_description, company_name, job_title).result()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import numpy as np
+from core import MODEL_NAME, ONNX_DIR, MAX_TOKENS, TorchEncoder, OnnxEncoder, load_real_db, skill_matrix, skill_vector, hybrid_score, score_drift, timed_encode, pdf_text, SKILL_MATCHER
+
+# === ЭКСПОРТ all-MiniLM-L6-v2 В ONNX (int8) + ПРОВЕРКА ТОЧНОСТИ ПРОТИВ PYTORCH ===
+
+def export(out_dir):
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(MODEL_NAME)
+    bert = model[0].auto_model.eval()
+
+    class Hidden(torch.nn.Module):
+        # Экспортируем только трансформер: pooling и нормализация делаются в OnnxEncoder на NumPy
+        def __init__(self, bert):
+            super().__init__()
+            self.bert = bert
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.bert(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32 = os.path.join(out_dir, "model.onnx")
+    dummy = model.tokenizer(["Junior Python Developer"], return_tensors="pt")
+    dynamic = {"batch": 0, "tokens": 1}
+    with torch.no_grad():
+        torch.onnx.export(Hidden(bert), (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]), fp32,
+                          input_names=["input_ids", "attention_mask", "token_type_ids"], output_names=["last_hidden_state"],
+                          dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic,
+                                        "last_hidden_state": dynamic}, opset_version=14)
+    quantize_dynamic(fp32, os.path.join(out_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+    os.remove(fp32)
+    model.tokenizer.backend_tokenizer.save(os.path.join(out_dir, "tokenizer.json"))
+    size = os.path.getsize(os.path.join(out_dir, "model_int8.onnx")) / 2**20
+    print(f"✅ Exported {MODEL_NAME} → {out_dir}/model_int8.onnx ({size:.1f} MB, max {MAX_TOKENS} tokens)")
+
+def check(out_dir, n_jobs, n_queries, cv_paths, batch_size, k):
+    """Гибридные скоры ONNX int8 против PyTorch на текущей базе. Возвращает максимальное отклонение в баллах."""
+    df = load_real_db(['title', 'description', 'skills'])
+    if df.empty: return print("⚠️ Database empty.")
+    rng = np.random.default_rng(0)
+    df = df.iloc[np.sort(rng.choice(len(df), min(n_jobs, len(df)), replace=False))]
+    texts = df['description'].astype(str).tolist()
+    queries = [texts[i] for i in rng.choice(len(texts), min(n_queries, len(texts)), replace=False)]
+    queries += [pdf_text(p) for p in cv_paths]
+
+    torch_enc, onnx_enc = TorchEncoder(), OnnxEncoder(out_dir)
+    torch_embs, torch_s = timed_encode(torch_enc, texts, batch_size)
+    onnx_embs, onnx_s = timed_encode(onnx_enc, texts, batch_size)
+    torch_ms, onnx_ms = torch_s / len(texts) * 1000, onnx_s / len(texts) * 1000
+    torch_q, onnx_q = torch_enc.encode(queries), onnx_enc.encode(queries)
+    agreement = (torch_embs * onnx_embs).sum(axis=1)
+
+    job_skills = skill_matrix(df['skills'])
+    totals = np.diff(job_skills.indptr)[:, None]
+    cv_vecs = np.stack([skill_vector(s) for s in SKILL_MATCHER.find_batch(queries)], axis=1)
+    common = np.asarray(job_skills @ cv_vecs)
+    ref = hybrid_score(torch_embs @ torch_q.T, common, totals)
+    got = hybrid_score(onnx_embs @ onnx_q.T, common, totals)
+    worst, mean, overlap = score_drift(ref, got, k)
+
+    print(f"{len(texts)} jobs × {len(queries)} queries")
+    print(f"encode: torch {torch_ms:.2f} ms/text, onnx-int8 {onnx_ms:.2f} ms/text ({torch_ms / onnx_ms:.1f}x)")
+    print(f"embedding cosine torch↔onnx: min {agreement.min():.4f}, mean {agreement.mean():.4f}")
+    print(f"hybrid score deviation: max {worst:.2f}, mean {mean:.3f} points; top-{k} overlap {overlap:.3f}")
+    return worst
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the encoder to int8 ONNX and check it against PyTorch")
+    parser.add_argument("--out", default=ONNX_DIR)
+    parser.add_argument("--check-only", action="store_true", help="Skip export, only compare with PyTorch")
+    parser.add_argument("--jobs", type=int, default=1000, help="Job descriptions sampled for the check")
+    parser.add_argument("--queries", type=int, default=20, help="Job descriptions used as CV queries")
+    parser.add_argument("--cv", nargs="*", default=[], help="CV PDFs used as extra queries")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--max-diff", type=float, default=2.0, help="Fail if any hybrid score moves more than this many points")
+    args = parser.parse_args()
+
+    if not args.check_only: export(args.out)
+    worst = check(args.out, args.jobs, args.queries, args.cv, args.batch_size, args.k)
+    if worst is None: return
+    if worst > args.max_diff:
+        print(f"❌ ONNX scores deviate up to {worst:.2f} points (> {args.max_diff}). Keep SCORER_ENCODER=torch.")
+        sys.exit(1)
+    print("✅ Within tolerance. Enable with SCORER_ENCODER=onnx.")
+
+if __name__ == "__main__":
+    main()
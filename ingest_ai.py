@@ -1,72 +1,219 @@
-import google.generativeai as genai
-import pandas as pd
+import argparse
 import json
-import toml
 import os
+import queue
+import random
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from core import ScorerEngine, JobStore
+
+MODELS = ['models/gemini-2.0-flash', 'models/gemini-1.5-pro-latest', 'gemini-1.5-flash']
+# Та же пропорция, что в исходном запросе на 40 вакансий: 25 junior / 10 ловушек / 5 senior
+MIX = {"junior": 25, "trap": 10, "senior": 5}
+KIND_PROMPTS = {
+    "junior": """Valid Junior Roles:
+       - Python Dev, Data Analyst, Java Junior, React Dev, QA Tester, DevOps Junior.
+       - Varied stacks and companies.""",
+    "trap": """"TRAP" Roles (The fake juniors):
+       - Title must say "Junior" or "Intern".
+       - BUT Description must explicitly demand "3+ years experience", "5 years commercial experience", or "Senior level knowledge".
+       - These are to test my spam filter. Make them look tricky!""",
+    "senior": """Senior Roles:
+       - Title says "Senior", "Lead", "Manager".""",
+}
+REQUIRED = ("title", "company", "description")
 
 def get_api_key():
     secrets_path = ".streamlit/secrets.toml"
     if os.path.exists(secrets_path):
         try:
+            import toml
             data = toml.load(secrets_path)
             if "GEMINI_API_KEY" in data: return data["GEMINI_API_KEY"]
         except: pass
     return input("Gemini API Key: ").strip()
 
-def generate_synthetic_jobs(api_key):
-    genai.configure(api_key=api_key)
-    # Используем модель с большим контекстом, чтобы влезло 40 вакансий
-    models = ['models/gemini-2.0-flash', 'models/gemini-1.5-pro-latest', 'gemini-1.5-flash']
-    model = None
-    
-    for m in models:
-        try:
-            model = genai.GenerativeModel(m)
-            break
-        except: continue
-        
-    if not model: return []
-    
-    print(f"🤖 Generating 40 jobs with {model} (this may take 30-40 seconds)...")
-
-    prompt = """
-    Generate 40 realistic IT job postings for Prague (Czechia).
+def build_prompt(kind, n):
+    return f"""
+    Generate {n} realistic IT job postings for Prague (Czechia).
     Output MUST be a valid JSON array.
-    
+
     Keys per object: "title", "company", "description", "Location", "url" (set to "#").
-    
-    DISTRIBUTION:
-    1. Valid Junior Roles (25 jobs):
-       - Python Dev, Data Analyst, Java Junior, React Dev, QA Tester, DevOps Junior.
-       - Varied stacks and companies.
-       
-    2. "TRAP" Roles (The fake juniors) (10 jobs):
-       - Title must say "Junior" or "Intern".
-       - BUT Description must explicitly demand "3+ years experience", "5 years commercial experience", or "Senior level knowledge".
-       - These are to test my spam filter. Make them look tricky!
-       
-    3. Senior Roles (5 jobs):
-       - Title says "Senior", "Lead", "Manager".
-    
+
+    All {n} jobs are {KIND_PROMPTS[kind]}
+
     Format: JSON Array only. No markdown.
     """
-    
-    try:
-        response = model.generate_content(prompt)
-        text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
-    except Exception as e:
-        print(f"Error: {e}")
-        return []
-
-def save_to_csv(jobs):
-    if not jobs: return
-    df = pd.DataFrame(jobs)
-    df["source"] = "Gemini Synthetic"
-    df.to_csv("live_jobs.csv", index=False)
-    print(f"🎉 Saved {len(df)} jobs (including TRAPS) to live_jobs.csv")
+
+# === БЭКЕНДЫ: потоковая генерация текста ответа ===
+class GeminiBackend:
+    source = "Gemini Synthetic"
+
+    def __init__(self, api_key, models=MODELS):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.models = [genai.GenerativeModel(m) for m in models]
+
+    def stream(self, kind, n):
+        # Следующая модель пробуется, только если предыдущая упала до первого куска ответа
+        for i, model in enumerate(self.models):
+            started = False
+            try:
+                for chunk in model.generate_content(build_prompt(kind, n), stream=True):
+                    started = True
+                    yield chunk.text
+                return
+            except Exception:
+                if started or i == len(self.models) - 1: raise
+
+class FakeBackend:
+    """
+    Офлайн-бэкенд для нагрузочных прогонов: вакансии из ingest_fake, ответ отдаётся кусками
+    по chunk_size символов с задержкой delay. malformed — доля битых объектов, fail — доля упавших запросов.
+    """
+    source = "Fake Stream"
+
+    def __init__(self, delay=0.01, chunk_size=64, malformed=0.05, fail=0.0, seed=None):
+        self.delay, self.chunk_size, self.malformed, self.fail = delay, chunk_size, malformed, fail
+        self.rng = random.Random(seed)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def stream(self, kind, n):
+        from ingest_fake import generate_mock_jobs
+        with self._lock:
+            first_id, seed = self._next_id, self.rng.random()
+            self._next_id += n
+            broken = [self.rng.random() < self.malformed for _ in range(n)]
+            fails = self.rng.random() < self.fail
+        rng = random.Random(seed)
+        items = []
+        for job, bad in zip(generate_mock_jobs(n, seed, save=False, first_id=first_id).to_dict("records"), broken):
+            job["url"] = "#"
+            if bad and rng.random() < 0.5: items.append('{"title": "' + job["title"] + '", "company": , "description": "trailing comma",}')
+            elif bad: items.append(json.dumps({"title": job["title"], "company": job["company"]}))
+            else: items.append(json.dumps(job, ensure_ascii=False))
+        text = "```json\n[\n  " + ",\n  ".join(items) + "\n]\n```"
+        for i in range(0, len(text), self.chunk_size):
+            if self.delay: time.sleep(self.delay)
+            if fails and i >= len(text) // 2: raise RuntimeError("stream interrupted")
+            yield text[i:i + self.chunk_size]
+
+# === ПОТОКОВЫЙ РАЗБОР JSON ===
+def iter_json_objects(chunks):
+    """
+    Выдаёт (объект или None, сырой текст) для каждого {...} верхнего уровня по мере прихода кусков.
+    Битый объект не мешает соседним: каждый разбирается отдельно.
+    """
+    depth, in_str, esc, buf = 0, False, False, []
+    for chunk in chunks:
+        for ch in chunk:
+            if depth == 0:
+                if ch == '{': depth, buf = 1, ['{']
+                continue
+            buf.append(ch)
+            if in_str:
+                if esc: esc = False
+                elif ch == '\\': esc = True
+                elif ch == '"': in_str = False
+            elif ch == '"': in_str = True
+            elif ch == '{': depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth: continue
+                raw = ''.join(buf)
+                try: yield json.loads(raw), raw
+                except json.JSONDecodeError: yield None, raw
+
+def validate_job(obj):
+    """(вакансия, None) или (None, причина отказа)."""
+    if not isinstance(obj, dict): return None, "invalid json"
+    for key in REQUIRED:
+        if not isinstance(obj.get(key), str) or not obj[key].strip(): return None, f"missing {key}"
+    if len(obj["description"]) < 40: return None, "description too short"
+    return {"title": obj["title"].strip(), "company": obj["company"].strip(), "description": obj["description"].strip(),
+            "Location": str(obj.get("Location") or "Prague (Czechia)"), "url": str(obj.get("url") or "#")}, None
+
+def plan_requests(total, batch):
+    """Список (вид, n): total вакансий в пропорции MIX, не больше batch на запрос."""
+    counts = {kind: round(total * share / sum(MIX.values())) for kind, share in MIX.items()}
+    counts["junior"] += total - sum(counts.values())
+    plan = [(kind, min(batch, left - i)) for kind, left in counts.items() for i in range(0, left, batch)]
+    random.Random(0).shuffle(plan)  # ловушки и senior приходят вперемешку, а не в конце
+    return plan
+
+# === ИНГЕСТ ===
+def ingest(backend, total=40, batch=5, workers=8, flush=20, flush_seconds=2.0, store=None, engine=None):
+    """
+    Много маленьких запросов параллельно; каждая вакансия валидируется отдельно и дописывается
+    в хранилище пачками по flush штук (или раз в flush_seconds) вместе с навыками и эмбеддингами.
+    """
+    store = store or JobStore()
+    engine = engine or ScorerEngine()
+    plan = plan_requests(total, batch)
+    out, done = queue.Queue(), object()
+    stats = Counter()
+    rejected = Counter()
+
+    def worker(kind, n):
+        try:
+            for obj, _ in iter_json_objects(backend.stream(kind, n)): out.put(validate_job(obj))
+        except Exception as e:
+            out.put((None, f"request failed: {type(e).__name__}"))
+        finally:
+            out.put(done)
+
+    def write(rows):
+        if not rows: return
+        df = pd.DataFrame(rows)
+        df["source"] = backend.source
+        added = store.append(df, engine)
+        stats["added"] += added
+        stats["duplicates"] += len(df) - added
+        print(f"   +{added} jobs ({stats['added']} total, {time.perf_counter() - start:.1f}s)")
+        rows.clear()
+
+    print(f"🤖 Generating {total} jobs in {len(plan)} requests × ≤{batch} with {workers} workers...")
+    start = time.perf_counter()
+    rows, finished, last_flush = [], 0, time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for kind, n in plan: pool.submit(worker, kind, n)
+        while finished < len(plan):
+            try: item = out.get(timeout=flush_seconds)
+            except queue.Empty: item = None
+            if item is done: finished += 1
+            elif item is not None:
+                job, error = item
+                if job: rows.append(job)
+                else: rejected[error] += 1
+            if len(rows) >= flush or (rows and time.perf_counter() - last_flush >= flush_seconds):
+                write(rows)
+                last_flush = time.perf_counter()
+    write(rows)
+
+    elapsed = time.perf_counter() - start
+    print(f"🎉 Saved {stats['added']} new jobs (including TRAPS) in {elapsed:.1f}s, {stats['duplicates']} duplicates skipped")
+    if rejected: print("⚠️ Rejected: " + ", ".join(f"{reason} ×{n}" for reason, n in rejected.most_common()))
+    return stats["added"]
 
 if __name__ == "__main__":
-    key = get_api_key()
-    if key: save_to_csv(generate_synthetic_jobs(key))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic job postings with Gemini into the job store")
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--batch", type=int, default=5, help="Jobs per request")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    parser.add_argument("--flush", type=int, default=20, help="Jobs per store append")
+    parser.add_argument("--fake", action="store_true", help="Offline fake backend (load testing)")
+    parser.add_argument("--delay", type=float, default=0.01, help="Fake backend: seconds per streamed chunk")
+    parser.add_argument("--malformed", type=float, default=0.05, help="Fake backend: share of broken objects")
+    parser.add_argument("--fail", type=float, default=0.0, help="Fake backend: share of requests failing mid-stream")
+    args = parser.parse_args()
+
+    if args.fake: backend = FakeBackend(args.delay, malformed=args.malformed, fail=args.fail)
+    else:
+        key = get_api_key()
+        if not key: raise SystemExit
+        backend = GeminiBackend(key)
+    ingest(backend, args.jobs, args.batch, args.workers, args.flush)
@@ -1,75 +1,105 @@
+import argparse
 import pandas as pd
 import random
+from core import ScorerEngine, JobStore
 
-def generate_mock_jobs():
-    print("⚠️ API не отвечает, генерируем синтетические данные для Праги...")
+# Базы для генерации
+companies = ["Avast", "JetBrains", "Kiwi.com", "Productboard", "Pure Storage", "Oracle", "Microsoft", "Seznam.cz", "Rohlik Group", "Barclays",
+             "Bad Corp", "Ataccama", "Mews", "Livesport", "Socialbakers", "Red Hat", "Adastra", "Deloitte", "Skoda Auto", "CSOB"]
+locations = ["Prague (Czechia)", "Remote / Prague", "Brno (Czechia)", "Remote", "Ostrava (Czechia)"]
+titles_junior = ["Junior Python Developer", "Intern Data Analyst", "Junior Software Engineer", "Python Intern", "Entry-level Data Scientist", "Junior Backend Developer",
+                 "Junior Java Developer", "Junior Frontend Developer", "QA Intern", "Junior DevOps Engineer", "Graduate Data Engineer", "Junior BI Analyst"]
+titles_senior = ["Senior Python Developer", "Lead Data Scientist", "Senior Software Engineer", "Team Lead", "Principal Engineer",
+                 "Engineering Manager", "Head of Data", "Sr. Backend Developer", "Director of Engineering", "Software Engineer III"]
 
-    # Базы для генерации
-    companies = ["Avast", "JetBrains", "Kiwi.com", "Productboard", "Pure Storage", "Oracle", "Microsoft", "Seznam.cz", "Rohlik Group", "Barclays"]
-    titles_junior = ["Junior Python Developer", "Intern Data Analyst", "Junior Software Engineer", "Python Intern", "Entry-level Data Scientist", "Junior Backend Developer"]
-    titles_senior = ["Senior Python Developer", "Lead Data Scientist", "Senior Software Engineer", "Team Lead", "Principal Engineer"]
-    
-    # Шаблоны описаний (с ключевыми словами)
-    desc_templates = [
-        "We are looking for a {role} to join our team in Prague. You will work with {stack}. Requirements: Basic knowledge of {stack}, Git, and English. Great opportunity for students.",
-        "Join our fast-growing startup as a {role}. Stack: {stack}. We offer flexible hours and remote options.",
-        "Hiring a {role}! If you know {stack} and want to learn more, apply now. Mentorship program available.",
-        "Requires 5+ years of experience in {stack}. Leading a team of developers.", # Ловушка для фильтра
-        "Looking for a passionate {role}. Must have experience with {stack}, Docker, and CI/CD."
-    ]
+# Шаблоны описаний (с ключевыми словами)
+desc_templates = [
+    "We are looking for a {role} to join our team in Prague. You will work with {stack}. Requirements: Basic knowledge of {stack}, Git, and English. Great opportunity for students.",
+    "Join our fast-growing startup as a {role}. Stack: {stack}. We offer flexible hours and remote options.",
+    "Hiring a {role}! If you know {stack} and want to learn more, apply now. Mentorship program available.",
+    "Requires 5+ years of experience in {stack}. Leading a team of developers.", # Ловушка для фильтра
+    "Looking for a passionate {role}. Must have experience with {stack}, Docker, and CI/CD."
+]
+# Формулировки "фейкового джуна" — разные способы попросить 3+ года опыта
+trap_phrases = [
+    "Must have {years}+ years of commercial experience in {skill}.",
+    "{years} years commercial experience with {skill} is required.",
+    "Minimum {years} - years of hands-on {skill} development.",
+    "Ideal candidate has {years} years in production {skill} projects.",
+]
+filler = [
+    "Hybrid work, 25 days of vacation and a MultiSport card.", "You will pair with senior engineers every day.",
+    "Our product is used by millions of customers across Europe.", "We value code reviews, testing and clean architecture.",
+    "Czech is a plus but not required.", "Budget for conferences and courses.", "Flexible start date for students.",
+]
 
-    tech_stacks = ["Python, SQL, Pandas", "Java, Spring Boot", "Python, Django, React", "Data Analysis, SQL, Tableau", "Machine Learning, PyTorch, Python"]
+tech_stacks = ["Python, SQL, Pandas", "Java, Spring Boot", "Python, Django, React", "Data Analysis, SQL, Tableau", "Machine Learning, PyTorch, Python"]
+# Для больших корпусов — стеки по направлениям, чтобы навыки распределялись как на реальном рынке
+skill_pools = [
+    ["Python", "SQL", "Pandas", "NumPy", "Airflow", "Docker", "AWS", "Git"],
+    ["Java", "Spring Boot", "SQL", "Kafka", "Kubernetes", "Jenkins", "Git", "OOP"],
+    ["JavaScript", "TypeScript", "React", "HTML", "CSS", "GraphQL", "Node.js", "Jira"],
+    ["SQL", "Excel", "Power BI", "Tableau", "DAX", "Statistics", "ETL", "English"],
+    ["Python", "PyTorch", "TensorFlow", "scikit-learn", "NLP", "LLM", "Docker", "GCP"],
+    ["Linux", "Bash", "Terraform", "Ansible", "AWS", "Azure", "Kubernetes", "GitLab CI"],
+    ["C#", ".NET", "Azure", "SQL", "Agile", "Scrum", "Git", "Communication"],
+]
+
+def random_stack(rng):
+    pool = rng.choice(skill_pools)
+    return ", ".join(rng.sample(pool, rng.randint(2, 5)))
+
+def generate_mock_jobs(n_jobs=23, seed=None, save=True, first_id=0):
+    """
+    Синтетические вакансии в той же пропорции, что и исходные 23 (15 junior / 5 senior / 3 ловушки).
+    n_jobs масштабирует корпус до 1k-1M строк для бенчмарков; save=False только возвращает DataFrame.
+    first_id сдвигает Job ID, чтобы несколько вызовов не давали одинаковых описаний.
+    """
+    rng = random.Random(seed)
+    n_senior, n_fake = round(n_jobs * 5 / 23), round(n_jobs * 3 / 23)
+    n_junior = n_jobs - n_senior - n_fake
+    if save: print(f"⚠️ API не отвечает, генерируем {n_jobs} синтетических вакансий...")
+
+    def job(i, title, desc, location, url):
+        # Job ID делает описания уникальными, иначе хранилище отбросит одинаковые шаблоны (почти-дубликаты же свяжутся с канонической)
+        return {"title": title, "company": rng.choice(companies), "description": f"{desc} {rng.choice(filler)} Job ID: MOCK-{first_id + i:07d}.",
+                "Location": location, "url": url, "source": "Mock Data"}
 
     jobs = []
 
-    # 1. Генерируем 15 идеальных JUNIOR вакансий
-    for _ in range(15):
-        stack = random.choice(tech_stacks)
-        title = random.choice(titles_junior)
-        desc = random.choice(desc_templates[:3]).format(role=title, stack=stack)
-        
-        jobs.append({
-            "title": title,
-            "company": random.choice(companies),
-            "description": desc,
-            "Location": random.choice(["Prague (Czechia)", "Remote / Prague"]),
-            "url": "https://www.startupjobs.cz/en",
-            "source": "Mock Data"
-        })
+    # 1. Генерируем идеальные JUNIOR вакансии
+    for _ in range(n_junior):
+        stack = rng.choice(tech_stacks) if n_jobs <= 23 else random_stack(rng)
+        title = rng.choice(titles_junior)
+        desc = rng.choice(desc_templates[:3]).format(role=title, stack=stack)
+        jobs.append(job(len(jobs), title, desc, rng.choice(locations), "https://www.startupjobs.cz/en"))
 
-    # 2. Генерируем 5 SENIOR вакансий (чтобы проверить работу фильтров Anti-Senior)
-    for _ in range(5):
-        stack = random.choice(tech_stacks)
-        title = random.choice(titles_senior)
-        desc = "We need a Senior expert with 5+ years of experience. High salary."
-        
-        jobs.append({
-            "title": title,
-            "company": random.choice(companies),
-            "description": desc,
-            "Location": "Prague (Czechia)",
-            "url": "#",
-            "source": "Mock Data"
-        })
+    # 2. Генерируем SENIOR вакансии (чтобы проверить работу фильтров Anti-Senior)
+    for _ in range(n_senior):
+        desc = f"We need a Senior expert with {rng.randint(5, 10)}+ years of experience in {random_stack(rng)}. High salary."
+        jobs.append(job(len(jobs), rng.choice(titles_senior), desc, rng.choice(locations), "#"))
 
-    # 3. Генерируем 3 "Фейковых Джуна" (Junior title, но 3+ years experience) - проверка Smart Filter
-    for _ in range(3):
-        jobs.append({
-            "title": "Junior Python Developer",
-            "company": "Bad Corp",
-            "description": "Looking for a Junior dev. Must have 4+ years of commercial experience in Python.",
-            "Location": "Prague (Czechia)",
-            "url": "#",
-            "source": "Mock Data"
-        })
+    # 3. Генерируем "Фейковых Джунов" (Junior title, но 3+ years experience) - проверка Smart Filter
+    for _ in range(n_fake):
+        stack = random_stack(rng)
+        trap = rng.choice(trap_phrases).format(years=rng.randint(3, 8), skill=stack.split(", ")[0])
+        desc = f"Looking for a Junior dev. {trap} Stack: {stack}."
+        jobs.append(job(len(jobs), rng.choice(titles_junior), desc, rng.choice(locations), "#"))
 
-    # Сохраняем
     df = pd.DataFrame(jobs)
-    df.to_csv("live_jobs.csv", index=False)
-    print(f"✅ УСПЕХ! Сгенерировано {len(df)} вакансий в 'live_jobs.csv'.")
-    print("   - Из них настоящих Junior: ~15")
-    print("   - Ловушек (Senior/Fake): ~8 (они должны исчезнуть в приложении)")
+    if not save: return df
+
+    # Дописываем в хранилище (дубликаты отбрасываются), эмбеддинги считаются сразу
+    added = JobStore().append(df, ScorerEngine())
+    print(f"✅ УСПЕХ! Сгенерировано {len(df)} вакансий, новых в хранилище: {added}.")
+    print(f"   - Из них настоящих Junior: ~{n_junior}")
+    print(f"   - Ловушек (Senior/Fake): ~{n_senior + n_fake} (они должны исчезнуть в приложении)")
     print("🚀 Запускай: streamlit run app.py")
+    return df
 
 if __name__ == "__main__":
-    generate_mock_jobs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic job postings into the job store")
+    parser.add_argument("--jobs", type=int, default=23)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    generate_mock_jobs(args.jobs, args.seed)
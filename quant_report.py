@@ -0,0 +1,45 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from core import ScorerEngine, CompactVectors, JOBS_CSV, SKILL_MATCHER, skill_matrix, skill_vector, hybrid_score, score_drift
+
+# Отчёт: насколько float16 / int8 векторы вакансий сдвигают гибридный скор относительно float32
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid score deviation of float16/int8 job vectors against float32")
+    parser.add_argument("--csv", default=JOBS_CSV, help="Jobs CSV to validate on")
+    parser.add_argument("--queries", type=int, default=50, help="Job descriptions sampled as CV queries")
+    parser.add_argument("--cv", nargs="*", default=[], help="CV PDFs used as extra queries")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).dropna(subset=['description'])
+    if df.empty: return print(f"⚠️ No jobs in {args.csv}")
+    engine = ScorerEngine()
+    texts = df['description'].astype(str).tolist()
+    embs = np.asarray(engine.index.lookup(engine.job_encoder, texts), dtype=np.float32)
+    job_skills = skill_matrix(SKILL_MATCHER.find_batch(texts))
+    totals = np.diff(job_skills.indptr)[:, None]
+
+    rng = np.random.default_rng(0)
+    cv_texts = [texts[i] for i in rng.choice(len(texts), min(args.queries, len(texts)), replace=False)]
+    cv_texts += [engine.extract_text_from_pdf(p) for p in args.cv]
+    cv_embs = np.stack([engine.encode_cv(t) for t in cv_texts], axis=1)
+    common = np.asarray(job_skills @ np.stack([skill_vector(s) for s in engine.extract_skills_batch(cv_texts)], axis=1))
+    k = min(args.k, len(df))
+
+    print(f"{len(df)} jobs × {len(cv_texts)} queries from {args.csv}")
+    ref = None
+    for precision in CompactVectors.PRECISIONS:
+        vectors = CompactVectors(embs, precision)
+        t0 = time.perf_counter()
+        semantic = vectors @ cv_embs
+        ms = (time.perf_counter() - t0) * 1000
+        scores = hybrid_score(semantic, common, totals)
+        if ref is None: ref = scores
+        worst, mean, overlap = score_drift(ref, scores, k)
+        print(f"{precision:>8}: {vectors.nbytes / 2**20:8.2f} MB  {ms:7.2f} ms  "
+              f"max dev {worst:.2f}  mean dev {mean:.4f} points  top-{k} overlap {overlap:.3f}")
+
+if __name__ == "__main__":
+    main()
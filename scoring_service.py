@@ -0,0 +1,283 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+from core import ScorerEngine, JobStore, LRUCache, METRICS, JOBS_CSV, SKILL_INDEX, SKILL_MATCHER, content_hash, load_real_db, pdf_text
+
+# === ОБЩИЙ СЕРВИС СКОРИНГА: одна модель на все сессии Streamlit ===
+DEFAULT_ADDRESS = "http://127.0.0.1:8765"  # или unix:/путь/к/сокету
+REQUEST_TIMEOUT = 60
+RESULT_COLUMNS = ['title', 'company', 'description', 'Location', 'url', 'filter_status', 'content_hash', 'duplicates', 'Score', 'Missing']
+
+class MicroBatcher:
+    """
+    Собирает запросы из разных потоков в пачки: до max_batch штук или max_wait_ms после первого
+    запроса в пачке. fn(items) выполняется в одном фоновом потоке и возвращает результат
+    (или исключение) для каждого элемента.
+    """
+    def __init__(self, fn, max_batch=32, max_wait_ms=10):
+        self.fn, self.max_batch, self.max_wait = fn, max_batch, max_wait_ms / 1000
+        self.sizes = Counter()  # размер пачки -> сколько раз
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0: break
+                try: batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty: break
+            self.sizes[len(batch)] += 1
+            try: results = self.fn([item for item, _ in batch])
+            except Exception as e: results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception): future.set_exception(result)
+                else: future.set_result(result)
+
+class ScoringService:
+    """
+    ScorerEngine за микробатчером: кодирование CV и поиск вакансий от всех сессий идут через один
+    поток, поэтому движку не нужна синхронизация, а CV из одной пачки кодируются одним вызовом модели.
+    """
+    def __init__(self, engine=None, max_batch=32, max_wait_ms=10, store_path=None):
+        self.engine = engine or ScorerEngine()
+        self.store = JobStore(store_path) if store_path else JobStore()
+        self.df, self._parts, self._meta = None, None, None
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(self._run_batch, max_batch, max_wait_ms)
+
+    def jobs(self):
+        # Ингест дописал части — перечитываем базу (meta запрашивается из потоков HTTP, отсюда блокировка)
+        with self._lock:
+            parts = self.store.parts()
+            if self.df is None or parts != self._parts:
+                self.df = load_real_db(path=self.store.path)
+                self._parts = parts
+                self._meta = {"jobs": len(self.df), "locations": sorted(self.df['Location'].astype(str).unique().tolist()) if len(self.df) else []}
+            return self.df
+
+    def meta(self):
+        """Число вакансий и города: клиентам не нужна своя копия базы ради фильтров."""
+        self.jobs()
+        return self._meta
+
+    def _run_batch(self, items):
+        with METRICS.stage("service_batch", items=len(items)):
+            embs = self.engine.encode_cvs([item["cv_text"] for item in items])
+            df = self.jobs()
+            scored = self._score(items, df)
+            return [self._answer(item, emb, df, scored.get(i)) for i, (item, emb) in enumerate(zip(items, embs))]
+
+    def _score(self, items, df):
+        # Все CV поиска из пачки скорятся по базе одним умножением (вакансии × CV), а не по одному
+        search = [i for i, item in enumerate(items) if item["op"] == "search"]
+        if df.empty or not search: return {}
+        try:
+            for i in search:
+                if items[i].get("cv_skills") is None: items[i]["cv_skills"] = self.engine.extract_skills(items[i]["cv_text"])
+            scored = self.engine.score_many([items[i]["cv_text"] for i in search], [items[i]["cv_skills"] for i in search], df)
+            return dict(zip(search, scored))
+        except Exception as e:
+            return dict.fromkeys(search, e)
+
+    def _answer(self, item, emb, df, scored):
+        try:
+            if item["op"] == "encode": return {"embedding": emb.tolist()}
+            if df.empty: return {"jobs": []}
+            if isinstance(scored, Exception): raise scored
+            result = self.engine.top_jobs(scored, df, top_k=int(item.get("top_k", 100)),
+                                          location=item.get("location"), include_traps=bool(item.get("include_traps", True)))
+            return {"jobs": result[RESULT_COLUMNS].to_dict("records")}
+        except Exception as e:
+            return e
+
+    def stats(self):
+        return {"jobs": 0 if self.df is None else len(self.df), "batch_sizes": dict(sorted(self.batcher.sizes.items())),
+                "metrics": METRICS.totals}
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health": return self._send({"ok": True})
+            if self.path == "/stats": return self._send(service.stats())
+            if self.path == "/meta": return self._send(service.meta())
+            self._send({"error": "not found"}, 404)
+
+        def do_POST(self):
+            op = self.path.strip("/")
+            if op not in ("encode", "search"): return self._send({"error": "not found"}, 404)
+            try: item = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError: return self._send({"error": "invalid json"}, 400)
+            if not isinstance(item.get("cv_text"), str): return self._send({"error": "cv_text required"}, 400)
+            item["op"] = op
+            try: self._send(service.batcher.submit(item).result(timeout=REQUEST_TIMEOUT))
+            except Exception as e: self._send({"error": f"{type(e).__name__}: {e}"}, 500)
+
+        def _send(self, payload, code=200):
+            body = json.dumps(payload, ensure_ascii=False, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): pass
+
+    return Handler
+
+# Очередь соединений по умолчанию (5) мала для десятков одновременных сессий
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+def serve(address=DEFAULT_ADDRESS, max_batch=32, max_wait_ms=10):
+    service = ScoringService(max_batch=max_batch, max_wait_ms=max_wait_ms)
+    # Модель и база загружаются до первого запроса, а не на нём
+    service.batcher.submit({"op": "encode", "cv_text": "warmup"}).result()
+    handler = make_handler(service)
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path): os.remove(path)
+        server = ThreadingUnixHTTPServer(path, handler)
+    else:
+        url = urlparse(address)
+        server = LocalHTTPServer((url.hostname, url.port), handler)
+    print(f"🚀 Scoring service on {address}: {len(service.jobs())} jobs, micro-batches of ≤{max_batch} within {max_wait_ms} ms")
+    try: server.serve_forever()
+    finally: server.server_close()
+
+# === ТОНКИЙ КЛИЕНТ ДЛЯ app.py ===
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+class ScoringClient:
+    """
+    Замена ScorerEngine в app.py, когда задан SCORER_SERVICE: модель и база живут в сервисе.
+    PDF и навыки CV разбираются локально (модель для них не нужна), кодирование и поиск — в сервисе.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=REQUEST_TIMEOUT, cache_mb=32):
+        self.address, self.timeout = address, timeout
+        self.cache = LRUCache(cache_mb * 2**20)
+
+    def _call(self, method, path, payload=None):
+        if self.address.startswith("unix:"): conn = _UnixConnection(self.address[len("unix:"):], self.timeout)
+        else:
+            url = urlparse(self.address)
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+        try:
+            body = None if payload is None else json.dumps(payload).encode("utf-8")
+            conn.request(method, path, body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+        finally:
+            conn.close()
+        if response.status != 200: raise RuntimeError(f"Scoring service error: {data.get('error', response.status)}")
+        return data
+
+    def extract_text_from_pdf(self, uploaded_file):
+        try:
+            data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+            key = "pdf:" + content_hash(data)
+            text = self.cache.get(key)
+            if text is None:
+                text = pdf_text(data)
+                self.cache.put(key, text)
+            return text
+        except Exception as e:
+            return f"Error: {e}"
+
+    def extract_skills(self, text):
+        key = "skills:" + content_hash(text)
+        skills = self.cache.get(key)
+        if skills is None:
+            skills = sorted(SKILL_MATCHER.find(text), key=SKILL_INDEX.get)
+            self.cache.put(key, skills)
+        return skills
+
+    def encode_cv(self, cv_text):
+        return np.asarray(self._call("POST", "/encode", {"cv_text": cv_text})["embedding"], dtype=np.float32)
+
+    def search_jobs(self, cv_text, cv_skills, df=None, top_k=100, location=None, include_traps=True):
+        """Как ScorerEngine.search_jobs, но по базе сервиса; df не используется (оставлен для совместимости)."""
+        jobs = self._call("POST", "/search", {"cv_text": cv_text, "cv_skills": list(cv_skills), "top_k": top_k,
+                                              "location": location, "include_traps": include_traps})["jobs"]
+        return pd.DataFrame(jobs, columns=RESULT_COLUMNS)
+
+    def stats(self):
+        return self._call("GET", "/stats")
+
+    def meta(self):
+        """{"jobs": число вакансий, "locations": города} базы сервиса."""
+        return self._call("GET", "/meta")
+
+# === НАГРУЗОЧНЫЙ ТЕСТ ===
+def bench(address, clients, requests, op, repeat):
+    """Параллельные клиенты шлют CV-тексты (описания вакансий); печатает пропускную способность и перцентили."""
+    client = ScoringClient(address)
+    texts = pd.read_csv(JOBS_CSV)['description'].dropna().astype(str).tolist()
+    # По умолчанию каждый запрос — новый CV, чтобы мерить модель, а не кэш
+    cvs = [texts[i % len(texts)] + ("" if repeat else f" Ref {i}.") for i in range(requests)]
+
+    def one(cv_text):
+        t0 = time.perf_counter()
+        if op == "encode": client.encode_cv(cv_text)
+        else: client.search_jobs(cv_text, client.extract_skills(cv_text), top_k=100)
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool: latencies = np.array(list(pool.map(one, cvs))) * 1000
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{op}: {requests} requests from {clients} clients in {elapsed:.2f}s — {requests / elapsed:.1f} req/s, "
+          f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+    print(f"server batch sizes: {client.stats()['batch_sizes']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared scoring service (localhost HTTP or Unix socket)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve")
+    p.add_argument("--address", default=os.environ.get("SCORER_SERVICE", DEFAULT_ADDRESS), help="http://host:port or unix:/path")
+    p.add_argument("--max-batch", type=int, default=32)
+    p.add_argument("--max-wait-ms", type=float, default=10, help="How long the first request in a batch waits for others")
+    p = sub.add_parser("bench")
+    p.add_argument("--address", default=os.environ.get("SCORER_SERVICE", DEFAULT_ADDRESS))
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--op", choices=["encode", "search"], default="search")
+    p.add_argument("--repeat", action="store_true", help="Reuse the same CV texts (measures the cache)")
+    args = parser.parse_args()
+
+    if args.command == "serve": serve(args.address, args.max_batch, args.max_wait_ms)
+    else: bench(args.address, args.clients, args.requests, args.op, args.repeat)
+
+if __name__ == "__main__":
+    main()